@@ -1,8 +1,6 @@
 import flet as ft
-from headers.kpi import kpi_department, kpi_market, report_builder
 from logs.logger_class import GrabLogs
-from headers import file_ops, visuals, consolidate
-import pandas as pd
+from headers import app_data, background, view_cache
 import threading
 import subprocess
 import bt
@@ -22,6 +20,19 @@ class AppFace:
 
         self.modified_width = 0
 
+        # Heavy work runs on small thread pools, long jobs on their own; the rings show it is in progress
+        self.tasks = background.TaskRunner()
+        self.jobs = background.TaskRunner(background.JOB_WORKERS, "app-job")
+        self.upload_progress = ft.ProgressRing(width=20, height=20, visible=False)
+        self.dpt_progress = ft.ProgressRing(width=20, height=20, visible=False)
+        self.mkt_progress = ft.ProgressRing(width=20, height=20, visible=False)
+        self.report_progress = ft.ProgressRing(width=20, height=20, visible=False)
+        self.report_all_progress = ft.ProgressRing(width=20, height=20, visible=False)
+        self.dpt_table_cont = None
+        self.mkt_table_cont = None
+        # when linked, each table is restricted to the selection of the other one
+        self.linked = False
+
         # Add the file picker to the page
         self.file_picker = ft.FilePicker(on_result=self.on_file_selected)
         self.page.overlay.append(self.file_picker)
@@ -32,17 +43,18 @@ class AppFace:
         self.sidebar = self.create_sidebar()
         self.content = ft.Column(controls=[], expand=True)
 
+        # The raw data is only read when a page needs it, the dropdowns are filled once it is
+        self.data = app_data.AppData()
+        self.views = view_cache.ViewCache()
+
         # ComboBox and dropdowns for home page
-        self.dpt_raw_drop = consolidate.GatherData().form_combo("department")
         self.dpt_dropdown_var = None
-
-        self.mkt_raw_drop = consolidate.GatherData().form_combo("market")
         self.mkt_dropdown_var = None
 
         self.department_dropdown = ft.Dropdown(
             hint_text="Choose a department",
             width=200,
-            options=[ft.dropdown.Option(value) for value in self.dpt_raw_drop],
+            options=[],
             on_change=self.dpt_drop_changed,
         )
 
@@ -51,21 +63,20 @@ class AppFace:
         self.market_dropdown = ft.Dropdown(
             hint_text="Choose a market",
             width=200,
-            options=[ft.dropdown.Option(value) for value in self.mkt_raw_drop],
+            options=[],
             on_change=self.mkt_drop_changed,
         )
 
         self.market_empty_textlabel = ft.Text()
 
         # Combobox and dropdowns for reports page
-        self.dpt_rp_drop = consolidate.GatherData().form_combo("department")
         self.dpt_rp_drop_var = None
 
         self.dpt_rp_dropdown = ft.Dropdown(
             hint_text="Choose a department",
             width=300,
             height=60,
-            options=[ft.dropdown.Option(value) for value in self.dpt_rp_drop],
+            options=[],
             on_change=self.dpt_rp_drop_changed,
         )
 
@@ -84,6 +95,7 @@ class AppFace:
         )
         # Show initial content
         self.show_home
+        self.load_options()
 
     def create_sidebar(self):
         """
@@ -159,6 +171,61 @@ class AppFace:
             expand=True,
         )
 
+    def run_in_background(self, channel, work, on_result, progress, runner=None):
+        """
+        The function `run_in_background` shows a progress ring at once and runs `work` on a task pool,
+        then patches its result into the page. A newer task on the same channel makes this one stale,
+        and the result of a stale task is dropped.
+
+        :param channel: The part of the page the task updates, e.g. "department"
+        :param work: A callable without arguments doing the heavy work
+        :param on_result: A callable receiving the result of `work` and updating the controls
+        :param progress: The `ProgressRing` shown while the task runs
+        :param runner: The `TaskRunner` of the task, defaults to `self.tasks`; long jobs use `self.jobs`
+        """
+
+        def done(result):
+            progress.visible = False
+            on_result(result)
+            self.page.update()
+
+        def failed(error):
+            progress.visible = False
+            grab_logs = GrabLogs()
+            grab_logs.form_log(
+                f"{channel} task failed: {error}", grab_logs.get_level("error")
+            )
+            self.show_confimation("Something went wrong", str(error))
+
+        progress.visible = True
+        self.page.update()
+        (runner or self.tasks).submit(channel, work, done, failed)
+
+    def load_options(self):
+        """
+        The function `load_options` fills the dropdowns from the categories index of the raw data, in the
+        background so the window shows up first.
+        """
+
+        def fill(options):
+            departments, markets = options
+            self.department_dropdown.options = [
+                ft.dropdown.Option(value) for value in departments
+            ]
+            self.dpt_rp_dropdown.options = [
+                ft.dropdown.Option(value) for value in departments
+            ]
+            self.market_dropdown.options = [
+                ft.dropdown.Option(value) for value in markets
+            ]
+            self.page.update()
+
+        self.tasks.submit(
+            "options",
+            lambda: (self.data.options("department"), self.data.options("market")),
+            fill,
+        )
+
     def create_file_picker(self, e=None):
         self.file_picker.pick_files(allowed_extensions=["csv", "xlsx"])
 
@@ -166,22 +233,35 @@ class AppFace:
         if e.files:
             file_path = e.files[0].path
             self.file_output.value = f"Selected file: {file_path}"
-            self.page.update()
 
-            if file_path.endswith(".csv"):
-                df = pd.read_csv(file_path)
-            elif file_path.endswith(".xlsx"):
-                df = pd.read_excel(file_path)
-            else:
-                self.file_output.value = "Unsupported file type"
-                self.page.update()
-                return
-
-            self.process_data_frame(df)
+            def upload():
+                from headers import loader
+
+                try:
+                    df = loader.read_table(file_path)
+                except ValueError:
+                    return False
+                self.process_data_frame(df)
+                return True
+
+            def uploaded(done):
+                if not done:
+                    self.file_output.value = "Unsupported file type"
+                else:
+                    self.load_options()
+                    if self.dpt_table_cont is not None:
+                        self.refresh_dept_table()
+                        self.refresh_mkt_table()
+
+            self.run_in_background(
+                "upload", upload, uploaded, self.upload_progress, self.jobs
+            )
 
     def process_data_frame(self, df):
         print("Appending in")
-        file_ops.FilePrep()._append_to_df(df)
+        self.data.upload(df)
+        # the file signature may not change on coarse mtime file systems, so the views are dropped too
+        self.views.invalidate()
         print("Appending done. wait for the confirmation message")
 
         return self.show_confimation(
@@ -237,7 +317,7 @@ class AppFace:
                         ft.Text("Raw Data File Section"),
                         ft.FilledButton(
                             text="Open Raw Data",
-                            on_click=lambda e: file_ops.FilePrep().open_raw_data(),
+                            on_click=lambda e: self.data.file_prep().open_raw_data(),
                             tooltip="Opens the raw data file",
                         ),
                     ],
@@ -261,6 +341,7 @@ class AppFace:
                             tooltip="Choose a file to upload to the Database",
                             on_click=self.create_file_picker,
                         ),
+                        self.upload_progress,
                     ]
                 ),
                 margin=10,
@@ -287,10 +368,9 @@ class AppFace:
                                 ft.ElevatedButton(
                                     "Generate QvQ report",
                                     icon="add",
-                                    on_click=lambda _: report_builder.BuildReport(
-                                        self.dpt_rp_drop_var
-                                    ).build_report(),
+                                    on_click=self.generate_report,
                                 ),
+                                self.report_progress,
                             ]
                         ),
                     ]
@@ -307,12 +387,15 @@ class AppFace:
                 content=ft.Column(
                     [
                         ft.Text("Generate all QvQ reports"),
-                        ft.ElevatedButton(
-                            "Generate all",
-                            icon="add",
-                            on_click=lambda _: report_builder.BuildReport(
-                                self.dpt_rp_drop_var
-                            ).build_report_all(),
+                        ft.Row(
+                            [
+                                ft.ElevatedButton(
+                                    "Generate all",
+                                    icon="add",
+                                    on_click=self.generate_all_reports,
+                                ),
+                                self.report_all_progress,
+                            ]
                         ),
                     ]
                 ),
@@ -328,28 +411,90 @@ class AppFace:
 
         self.page.update()
 
+    def generate_report(self, e):
+        from headers.kpi import report_builder
+
+        dpt = self.dpt_rp_drop_var
+        if dpt is None:
+            self.dpt_rp_empty_textlabel.value = "Choose a department first"
+            self.page.update()
+            return
+
+        def reported(done):
+            self.dpt_rp_empty_textlabel.value = (
+                f"{dpt} report done" if done else f"{dpt} report failed, see the logs"
+            )
+
+        self.run_in_background(
+            f"report {dpt}",
+            lambda: report_builder.BuildReport(dpt).build_report(),
+            reported,
+            self.report_progress,
+            self.jobs,
+        )
+
+    def generate_all_reports(self, e):
+        from headers.kpi import report_builder
+
+        def reported(results):
+            counts = results["status"].value_counts()
+            self.show_confimation(
+                "Reports generated",
+                f"{counts.get('done', 0)} reports built, {counts.get('unchanged', 0)} unchanged, "
+                f"{counts.get('failed', 0)} failed",
+            )
+
+        self.run_in_background(
+            "report all",
+            lambda: report_builder.BuildReport(self.dpt_rp_drop_var).build_report_all(),
+            reported,
+            self.report_all_progress,
+            self.jobs,
+        )
+
     def dpt_drop_changed(self, e):
         self.dpt_dropdown_var = e.control.value
         self.department_empty_textlabel.value = (
             f"Selected Value: {self.dpt_dropdown_var}"
         )
-
-        self.content.controls[1].controls[1].content = self.update_dept_table(
-            self.dpt_dropdown_var
-        )
-
-        self.page.update()
+        self.refresh_dept_table()
+        if self.linked:
+            self.refresh_mkt_table()
 
     def mkt_drop_changed(self, e):
         self.mkt_dropdown_var = e.control.value
         self.market_empty_textlabel.value = f"Selected Value: {self.mkt_dropdown_var}"
-
-        # woould update with the following formula: self.content.controls[index].controls [val].content
-        self.content.controls[3].controls[1].content = self.update_mkt_table(
-            self.mkt_dropdown_var
+        self.refresh_mkt_table()
+        if self.linked:
+            self.refresh_dept_table()
+
+    def refresh_dept_table(self):
+        def patch(table):
+            if self.dpt_table_cont is not None:
+                self.dpt_table_cont.content = table
+
+        dpt = self.dpt_dropdown_var
+        mkt = self.mkt_dropdown_var if self.linked else None
+        self.run_in_background(
+            "department",
+            lambda: self.update_dept_table(dpt, mkt),
+            patch,
+            self.dpt_progress,
         )
 
-        self.page.update()
+    def refresh_mkt_table(self):
+        def patch(table):
+            if self.mkt_table_cont is not None:
+                self.mkt_table_cont.content = table
+
+        mkt = self.mkt_dropdown_var
+        dpt = self.dpt_dropdown_var if self.linked else None
+        self.run_in_background(
+            "market",
+            lambda: self.update_mkt_table(mkt, dpt),
+            patch,
+            self.mkt_progress,
+        )
 
     def dpt_rp_drop_changed(self, e):
         self.dpt_rp_drop_var = e.control.value
@@ -357,20 +502,35 @@ class AppFace:
 
         self.page.update()
 
-    def update_dept_table(self, cval):
-        df = file_ops.FilePrep().split_by_snap()[1]
-
-        df_to_convert = kpi_department.EmployeeAnalytics(df, cval).form_df()
+    def update_dept_table(self, cval, mkt=None):
+        return self.views.get_or_build(
+            self.data.dataset_version(),
+            "department",
+            (cval, mkt),
+            lambda: self.build_table("department", cval, mkt),
+        )
 
-        return ft.DataTable(
-            columns=consolidate.headers(df_to_convert),
-            rows=consolidate.rows(df_to_convert),
+    def update_mkt_table(self, cval, dpt=None):
+        return self.views.get_or_build(
+            self.data.dataset_version(),
+            "market",
+            (cval, dpt),
+            lambda: self.build_table("market", cval, dpt),
         )
 
-    def update_mkt_table(self, cval):
-        df = file_ops.FilePrep().split_by_snap()[1]
+    def build_table(self, column, cval, linked=None):
+        """
+        The function `build_table` builds the gender gap table of a department or market from the
+        cross-tab of the actual snapshot.
+
+        :param column: "department" or "market"
+        :param cval: The department or market looked at
+        :param linked: The market or department the table is restricted to, defaults to None
+        :return: A `ft.DataTable`.
+        """
+        from headers import consolidate
 
-        df_to_convert = kpi_market.CountryAnalytics(df, cval).form_df()
+        df_to_convert = self.data.actual_cube().linked_form_df(column, cval, linked)
 
         return ft.DataTable(
             columns=consolidate.headers(df_to_convert),
@@ -378,15 +538,12 @@ class AppFace:
         )
 
     def show_home(self, e):
-        table1 = self.update_dept_table(self.dpt_dropdown_var)
-        table2 = self.update_mkt_table(self.mkt_dropdown_var)
-
         combo_cont = ft.Container(
             content=ft.Column(
                 [
                     ft.Text("Department section"),
                     self.department_dropdown,
-                    self.department_empty_textlabel,
+                    ft.Row([self.department_empty_textlabel, self.dpt_progress]),
                 ]
             ),
             margin=10,
@@ -399,11 +556,7 @@ class AppFace:
         )
 
         table_cont = ft.Container(
-            content=ft.Row(
-                [
-                    table1,
-                ]
-            ),
+            content=ft.Row([]),
             bgcolor=ft.colors.GREEN_700,
             margin=10,
             alignment=ft.alignment.center,
@@ -417,7 +570,7 @@ class AppFace:
                 [
                     ft.Text("Market section"),
                     self.market_dropdown,
-                    self.market_empty_textlabel,
+                    ft.Row([self.market_empty_textlabel, self.mkt_progress]),
                 ]
             ),
             margin=10,
@@ -430,11 +583,7 @@ class AppFace:
         )
 
         market_table_cont = ft.Container(
-            content=ft.Row(
-                [
-                    table2,
-                ]
-            ),
+            content=ft.Row([]),
             bgcolor=ft.colors.GREEN_700,
             margin=10,
             alignment=ft.alignment.center,
@@ -443,18 +592,22 @@ class AppFace:
             padding=10,
         )
 
+        self.dpt_table_cont = table_cont
+        self.mkt_table_cont = market_table_cont
+
         if self.default_width < self.modified_width:
             self.page.width = self.modified_width
 
         def toggle_icon_button(e):
             e.control.selected = not e.control.selected
-            self.show_confimation("Data Linked", "Data have the same source")
+            self.linked = e.control.selected
             e.control.update()
+            self.refresh_dept_table()
+            self.refresh_mkt_table()
 
         self.content.controls = [
             ft.Text("Welcome to the KPI Reporting App"),  # index 0
             ft.Row([combo_cont, table_cont]),  # index 1
-            # TODO: Create an intersection class and link the data between the 2 tables. Not urgent
             ft.Row(
                 [
                     ft.IconButton(
@@ -464,7 +617,7 @@ class AppFace:
                         icon_size=40,
                         tooltip="Link department and market",
                         on_click=toggle_icon_button,
-                        selected=False,
+                        selected=self.linked,
                         style=ft.ButtonStyle(
                             color={
                                 "selected": ft.colors.GREEN_600,
@@ -503,7 +656,11 @@ class AppFace:
         threading.Timer(0.3, check_dimensions).start()
         self.page.update()
 
+        self.refresh_dept_table()
+        self.refresh_mkt_table()
+
     def show_plot(self, e):
+        from headers import visuals
 
         self.content.controls = [
             ft.Column(
@@ -0,0 +1,90 @@
+import threading
+
+"""
+@package docstring
+
+This file holds the data of the app window.
+A single `AppData` is shared by the pages of the app: it creates the `FilePrep` giving access to the raw
+data only when a page first needs it, and fills the dropdowns from the categories index instead of
+parsing the dataset once per dropdown. The modules reading the data are imported at that point too, so
+the window shows up before pandas and the KPI stack are loaded.
+
+"""
+
+
+class AppData:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._file_prep = None
+        self._cube = (None, None)
+
+    def file_prep(self):
+        """
+        The function `file_prep` returns the `FilePrep` of the app, creating it on first use.
+        :return: The shared `file_ops.FilePrep`.
+        """
+        with self._lock:
+            if self._file_prep is None:
+                from . import file_ops
+
+                self._file_prep = file_ops.FilePrep()
+            return self._file_prep
+
+    def options(self, column: str) -> list:
+        """
+        The function `options` lists the values of a categorical column, e.g. to fill a dropdown.
+
+        :param column: "department", "market", "gender" or "snapshot_date"
+        :type column: str
+        :return: The values of the column, or an empty list if the data cannot be read.
+        """
+        categories = self.file_prep().categories_index() or {}
+        return list(categories.get(column, []))
+
+    def upload(self, df):
+        """
+        The function `upload` adds uploaded rows to the raw data and forgets the cube of the previous
+        data.
+
+        :param df: The uploaded rows, see `FilePrep._append_to_df`
+        :return: The rows added, with their market.
+        """
+        new_rows = self.file_prep()._append_to_df(df)
+        with self._lock:
+            self._cube = (None, None)
+        return new_rows
+
+    def dataset_version(self):
+        """
+        The function `dataset_version` returns the version of the raw data, see `FilePrep.dataset_version`.
+        :return: A value that changes whenever the raw data is updated.
+        """
+        return self.file_prep().dataset_version()
+
+    def actual_snapshot(self):
+        """
+        The function `actual_snapshot` returns the KPI columns of the most recent snapshot.
+        :return: A DataFrame with the columns of `file_ops.KPI_COLUMNS`.
+        """
+        from . import file_ops
+
+        return self.file_prep().split_by_snap(file_ops.KPI_COLUMNS)[1]
+
+    def actual_cube(self):
+        """
+        The function `actual_cube` returns the kpi cube of the most recent snapshot, built once per
+        version of the raw data, so the department and market views are lookups on its cross-tab.
+        :return: The `kpi_cube.KpiCube` of `actual_snapshot()`.
+        """
+        from .kpi import kpi_cube
+
+        version = self.dataset_version()
+        with self._lock:
+            if self._cube[0] == version and self._cube[1] is not None:
+                return self._cube[1]
+
+        cube = kpi_cube.KpiCube(self.actual_snapshot())
+        cube.crosstab()
+        with self._lock:
+            self._cube = (version, cube)
+        return cube
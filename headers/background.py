@@ -0,0 +1,102 @@
+import itertools
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from logs.logger_class import GrabLogs
+
+"""
+@package docstring
+
+This file runs the heavy work of the app (tables, uploads, reports) outside of the Flet callbacks.
+The work goes to small pools of threads, so the window stays responsive: the app keeps one runner for
+the table views and another one for the long jobs (uploads, reports), so a report being built does not
+hold up the tables. Every task belongs to a channel (e.g. the department table): a new task on a
+channel cancels the pending one and marks the running one as stale, so only the result of the latest
+selection is patched into the page.
+
+"""
+
+
+# number of threads doing the heavy work of the app, kept small so rapid clicks can not flood the machine
+APP_WORKERS = 2
+
+# number of threads running the long jobs of the app (uploads, reports), which already use processes
+JOB_WORKERS = 1
+
+
+class TaskRunner:
+    def __init__(self, max_workers: int = APP_WORKERS, name: str = "app-task") -> None:
+        """
+        :param max_workers: The number of threads of the pool, defaults to `APP_WORKERS`
+        :param name: The prefix of the names of the threads, defaults to "app-task"
+        """
+        self._pool = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix=name
+        )
+        self._lock = threading.Lock()
+        self._tokens = itertools.count(1)
+        self._latest = {}
+        self._futures = {}
+
+    def submit(self, channel: str, work, on_result, on_error=None) -> int:
+        """
+        The function `submit` runs `work` on the pool and hands its result to `on_result`, unless a newer
+        task was submitted on the same channel in the meantime.
+
+        :param channel: The name of the part of the page the task updates, e.g. "department"
+        :type channel: str
+        :param work: A callable without arguments doing the heavy work
+        :param on_result: A callable receiving the result of `work`, called from the worker thread
+        :param on_error: A callable receiving the exception raised by `work`, defaults to logging it
+        (optional)
+        :return: The token of the task, see `is_current`.
+        """
+        with self._lock:
+            token = next(self._tokens)
+            self._latest[channel] = token
+            previous = self._futures.get(channel)
+            if previous is not None:
+                # only a task that did not start yet can be cancelled, a running one is dropped when done
+                previous.cancel()
+            self._futures[channel] = self._pool.submit(
+                self._run, channel, token, work, on_result, on_error
+            )
+        return token
+
+    def is_current(self, channel: str, token: int) -> bool:
+        """
+        The function `is_current` tells if a task is still the latest one of its channel.
+
+        :param channel: The channel of the task
+        :param token: The token returned by `submit`
+        :return: True if no newer task was submitted on the channel, False otherwise.
+        """
+        with self._lock:
+            return self._latest.get(channel) == token
+
+    def _run(self, channel, token, work, on_result, on_error):
+        if not self.is_current(channel, token):
+            return
+        try:
+            result = work()
+        except Exception as e:
+            if not self.is_current(channel, token):
+                return
+            if on_error is None:
+                traceback.print_exc()
+                grab_logs = GrabLogs()
+                grab_logs.form_log(
+                    f"Background task {channel} failed: {e}",
+                    grab_logs.get_level("error"),
+                )
+            else:
+                on_error(e)
+            return
+        if self.is_current(channel, token):
+            on_result(result)
+
+    def shutdown(self) -> None:
+        """
+        The function `shutdown` cancels the pending tasks and stops the threads once the running ones end.
+        """
+        self._pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,173 @@
+import flet as ft
+import numpy as np
+import pandas as pd
+
+"""
+@package docstring
+
+This file contains a paginated table control for large DataFrames.
+The DataFrame stays on the Python side: filtering and sorting only reorder an array of row positions,
+and only the rows of the visible page are turned into Flet controls, column by column, so showing a
+page does not depend on the number of rows. The filter compares the text to the distinct values of the
+searched columns only, each column being prepared the first time it is searched.
+
+"""
+
+
+PAGE_SIZE = 50
+
+
+def data_rows(df: pd.DataFrame) -> list:
+    """
+    The function `data_rows` turns the rows of a small DataFrame into Flet table rows, reading whole
+    columns instead of iterating over the rows.
+
+    :param df: The rows to show, missing values are shown as empty cells
+    :type df: pd.DataFrame
+    :return: A list of `ft.DataRow`, one per row of `df`.
+    """
+    columns = [
+        df[col].astype(object).where(df[col].notna(), "").tolist() for col in df.columns
+    ]
+    return [
+        ft.DataRow(cells=[ft.DataCell(ft.Text(str(value))) for value in row])
+        for row in zip(*columns)
+    ]
+
+
+class PagedDataTable(ft.Column):
+    def __init__(
+        self, df: pd.DataFrame, page_size: int = PAGE_SIZE, search_columns=None
+    ):
+        """
+        :param df: The DataFrame to show, treated as read-only
+        :param page_size: The number of rows of a page, defaults to `PAGE_SIZE`
+        :param search_columns: The columns searched by the filter, defaults to every column
+        """
+        super().__init__()
+        self.frame = df.reset_index(drop=True)
+        self.page_size = page_size
+        self.search_columns = list(
+            self.frame.columns if search_columns is None else search_columns
+        )
+        self.page_number = 0
+        # positions of the rows in `frame` that pass the filter, in the displayed order
+        self.positions = np.arange(len(self.frame))
+        self.filter_text = ""
+        self.sort_column_index = None
+        self.sort_ascending = True
+        self._lowered = {}
+
+        self.filter_field = ft.TextField(
+            hint_text="Filter rows",
+            width=250,
+            dense=True,
+            on_submit=self.filter_changed,
+        )
+        self.table = ft.DataTable(
+            columns=[
+                ft.DataColumn(ft.Text(str(col)), on_sort=self.sort_changed)
+                for col in self.frame.columns
+            ],
+            rows=[],
+        )
+        self.page_label = ft.Text()
+        self.previous_button = ft.IconButton(
+            icon=ft.icons.CHEVRON_LEFT, on_click=self.previous_page
+        )
+        self.next_button = ft.IconButton(
+            icon=ft.icons.CHEVRON_RIGHT, on_click=self.next_page
+        )
+        self.controls = [
+            self.filter_field,
+            self.table,
+            ft.Row([self.previous_button, self.page_label, self.next_button]),
+        ]
+        self.show_page()
+
+    def page_count(self) -> int:
+        return max(1, -(-len(self.positions) // self.page_size))
+
+    def show_page(self):
+        """
+        The function `show_page` builds the rows of the current page only.
+        """
+        self.page_number = min(max(self.page_number, 0), self.page_count() - 1)
+        start = self.page_number * self.page_size
+        window = self.frame.take(self.positions[start : start + self.page_size])
+
+        self.table.rows = data_rows(window)
+        self.table.sort_column_index = self.sort_column_index
+        self.table.sort_ascending = self.sort_ascending
+        self.page_label.value = (
+            f"Page {self.page_number + 1} of {self.page_count()} "
+            f"({len(self.positions)} rows)"
+        )
+        self.previous_button.disabled = self.page_number == 0
+        self.next_button.disabled = self.page_number >= self.page_count() - 1
+
+    def _refresh(self):
+        self.show_page()
+        if self.page is not None:
+            self.update()
+
+    def _text_of(self, col) -> tuple:
+        # the codes of the rows and the lowercase text of the distinct values of a column, built the first
+        # time the column is searched; a missing value has the code -1
+        if col not in self._lowered:
+            column = self.frame[col]
+            if isinstance(column.dtype, pd.CategoricalDtype):
+                codes, values = column.cat.codes.to_numpy(), column.cat.categories
+            else:
+                codes, values = pd.factorize(column)
+            text = pd.Series(values).astype(object).astype(str).str.lower()
+            self._lowered[col] = (codes, text)
+        return self._lowered[col]
+
+    def apply_view(self):
+        """
+        The function `apply_view` recomputes the rows passing the filter, in the sorted order.
+        """
+        positions = np.arange(len(self.frame))
+        if self.filter_text:
+            needle = self.filter_text.lower()
+            mask = np.zeros(len(self.frame), dtype=bool)
+            for col in self.search_columns:
+                codes, text = self._text_of(col)
+                found = text.str.contains(needle, regex=False).to_numpy()
+                # the extra False is picked by the code -1 of the missing values
+                mask |= np.append(found, False)[codes]
+            positions = positions[mask]
+
+        if self.sort_column_index is not None and len(positions):
+            column = self.frame.iloc[positions, self.sort_column_index]
+            order = (
+                column.reset_index(drop=True)
+                .sort_values(
+                    ascending=self.sort_ascending, kind="stable", na_position="last"
+                )
+                .index.to_numpy()
+            )
+            positions = positions[order]
+
+        self.positions = positions
+        self.page_number = 0
+
+    def filter_changed(self, e):
+        self.filter_text = (e.control.value or "").strip()
+        self.apply_view()
+        self._refresh()
+
+    def sort_changed(self, e):
+        self.sort_column_index = e.column_index
+        self.sort_ascending = e.ascending
+        self.apply_view()
+        self._refresh()
+
+    def previous_page(self, e):
+        self.page_number -= 1
+        self._refresh()
+
+    def next_page(self, e):
+        self.page_number += 1
+        self._refresh()
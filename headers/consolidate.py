@@ -1,6 +1,7 @@
 import pandas as pd
 from . import file_ops
 import flet as ft
+from .composite_controls import paged_table
 
 
 # The `GatherData` class initializes with a DataFrame and provides methods to retrieve unique values
@@ -17,10 +18,7 @@ class GatherData:
 
 
 def rows(df: pd.DataFrame) -> list:
-    return [
-        ft.DataRow(cells=[ft.DataCell(ft.Text(row[header])) for header in df.columns])
-        for _, row in df.iterrows()
-    ]
+    return paged_table.data_rows(df)
 
 
 def headers(df: pd.DataFrame) -> list:
@@ -0,0 +1,86 @@
+import os
+import threading
+import pandas as pd
+
+"""
+@package docstring
+
+This file keeps a process-wide cache of the parsed source files.
+Every FilePrep/GatherData instance asks this module for the dataset, and the file is only parsed again
+when its modification time or size changes on disk, or when the cache is invalidated explicitly.
+
+"""
+
+
+_lock = threading.RLock()
+_entries = {}
+
+
+def file_signature(path: str):
+    """
+    The function `file_signature` builds the key used to decide if a cached dataset is still valid.
+
+    :param path: The path of the file on disk
+    :type path: str
+    :return: A tuple `(mtime_ns, size)` describing the current state of the file, or `None` if the file
+    does not exist.
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def get_or_load(path: str, loader, variant=None):
+    """
+    The function `get_or_load` returns the parsed dataset for `path`, calling `loader` only when there is
+    no valid cached copy.
+
+    The returned DataFrame shares its data with the cached one and must be treated as read-only: adding or
+    dropping columns is safe, editing values in place is not.
+
+    :param path: The path of the source file, used together with its mtime and size as the cache key
+    :type path: str
+    :param loader: A callable without arguments that parses the file and returns a DataFrame (or any other
+    object derived from the file, such as an index) or `None`
+    :param variant: A hashable value telling apart different reads of the same file (e.g. a column
+    projection), defaults to None (optional)
+    :return: A shallow copy of the cached DataFrame (other objects are returned as they are), or `None`
+    if the loader could not read the file.
+    """
+    key = (os.path.abspath(path), variant)
+    with _lock:
+        signature = file_signature(path)
+        entry = _entries.get(key)
+        if entry is not None and signature is not None and entry[0] == signature:
+            return _share(entry[1])
+
+        content = loader()
+        if content is None or signature is None:
+            _entries.pop(key, None)
+            return content
+
+        _entries[key] = (signature, content)
+        return _share(content)
+
+
+def _share(content):
+    return content.copy(deep=False) if isinstance(content, pd.DataFrame) else content
+
+
+def invalidate(path: str = None):
+    """
+    The function `invalidate` drops every cached read of `path`, or every cached dataset when no path is
+    given. It must be called after the application itself writes to a source file.
+
+    :param path: The path of the file whose cache entry will be dropped, defaults to None (optional)
+    :type path: str
+    """
+    with _lock:
+        if path is None:
+            _entries.clear()
+        else:
+            abs_path = os.path.abspath(path)
+            for key in [key for key in _entries if key[0] == abs_path]:
+                del _entries[key]
@@ -8,6 +8,12 @@ import json
 from datetime import date, datetime
 import functools
 from . import market_map as mm
+from . import dataset_cache
+from . import snapshot_store
+from . import loader
+from . import schema
+from . import snapshot_index
+from . import quarter_calendar
 
 """
 @package docstring
@@ -17,6 +23,17 @@ Its primary purpose is to manage the source file, raw_data, by handling tasks su
 
 """
 
+# Columns needed by the KPI tables; loading only these keeps the snapshot reads small
+KPI_COLUMNS = (
+    "employee_id",
+    "first_name",
+    "last_name",
+    "gender",
+    "department",
+    "market",
+    "pay_grade",
+)
+
 
 # The `FilePrep` class in Python contains methods for opening, updating, appending, clearing, and
 # manipulating data in Excel files, with logging and error handling functionalities.
@@ -25,52 +42,227 @@ class FilePrep:
         self.file_name = "raw_data\\personnel3.xlsx"
         self.grab_logs = logger_class.GrabLogs()
         self.c_map = mm.CountryMapper()
+        self.store = snapshot_store.SnapshotStore()
 
     def open_raw_data(self):
         """
         This function returns an os process that opens the raw data file to the users for viewing.
+        The workbook is refreshed from the snapshot store first, so the users see the working copy.
         :param: self.file_name
         :return: os subprocess
         """
+        if self.__use_store():
+            self.export_raw_data()
         print(f"{self.file_name} will open shortly")
         path2file = os.getcwd() + "\\" + self.file_name
         return os.system(path2file)
 
     def update_df(self):
         """
-        This function updates a pandas DataFrame from a CSV or Excel file.
+        This function returns the pandas DataFrame parsed from the raw data file.
 
-        It first attempts to read the CSV file with UTF-8 encoding. If that fails,
-        it tries with Latin-1 encoding. If both attempts fail, it tries to read an Excel file.
-        Logs are recorded at each step, indicating success or failure.
+        When pyarrow is installed the data is read from the Parquet snapshot store, which is built from
+        the workbook on first use. Otherwise the workbook itself is parsed.
+        Either way the data is parsed only once per process and then served from `dataset_cache` until
+        the files change, so every FilePrep and GatherData instance shares the same parsed copy.
+        The columns are converted to the types declared in `schema`, the rows are sorted chronologically by
+        snapshot (see `snapshot_index`) and the returned DataFrame must be treated as read-only.
 
         :return: A pandas DataFrame containing the contents of the file specified by
         `self.file_name`, or `None` if the file is empty or cannot be read.
         """
-        try:
-            content = pd.read_csv(self.file_name, encoding="utf-8", low_memory=False)
-        except Exception:
-            try:
-                content = pd.read_csv(
-                    self.file_name, encoding="latin-1", low_memory=False
-                )
-                self.grab_logs.form_log(
-                    "Content converted to Latin-1 due to encoding issues",
-                    self.grab_logs.get_level("warn"),
+        if self.__use_store():
+            return dataset_cache.get_or_load(
+                self.store.manifest_path, self.__read_typed_store, variant="typed"
+            )
+        return dataset_cache.get_or_load(
+            self.file_name,
+            lambda: snapshot_index.sort_frame(
+                schema.apply_schema(self.__read_source())
+            ),
+            variant="typed",
+        )
+
+    def snapshot_index(self):
+        """
+        This function returns the index of the snapshots held by the raw data, in chronological order,
+        with the row range of each snapshot in the DataFrame returned by `update_df`.
+
+        With the snapshot store the index is built from the manifest alone, without reading any data.
+
+        :return: A `snapshot_index.SnapshotIndex`, or `None` if the data cannot be read.
+        """
+        if self.__use_store():
+            return snapshot_index.SnapshotIndex.from_counts(
+                self.store.snapshots(), self.store.row_counts()
+            )
+        return dataset_cache.get_or_load(
+            self.file_name,
+            lambda: snapshot_index.SnapshotIndex.from_frame(self.update_df()),
+            variant="index",
+        )
+
+    def categories_index(self) -> dict:
+        """
+        This function returns the values of the categorical columns of the raw data (department, market,
+        gender and snapshot_date), e.g. to fill the dropdowns of the app.
+
+        With the snapshot store the index is read from the manifest alone, without reading any data.
+
+        :return: A dictionary mapping each column to its values, or `None` if the data cannot be read.
+        """
+        if self.__use_store():
+            return self.store.categories()
+        return dataset_cache.get_or_load(
+            self.file_name, self.__read_categories, variant="categories"
+        )
+
+    def cache_key(self) -> str:
+        """
+        This function returns the file the data is read from, the key of every value cached from the data
+        in `dataset_cache`, so that the cached values expire whenever the data changes.
+
+        :return: The path of the snapshot store manifest, or the raw data file when the store is not used.
+        """
+        if self.__use_store():
+            return self.store.manifest_path
+        return self.file_name
+
+    def dataset_version(self):
+        """
+        This function returns the version of the raw data, which changes whenever the data is updated.
+
+        :return: The `(mtime_ns, size)` signature of the snapshot store manifest, or of the raw data file
+        when the store is not used, or `None` if neither exists.
+        """
+        return dataset_cache.file_signature(self.cache_key())
+
+    def __read_categories(self):
+        df = self.update_df()
+        if df is None:
+            return None
+        categories = schema.category_values(df)
+        snapshots = self.snapshot_index().snapshots
+        categories[snapshot_index.SNAP_COLUMN] = list(snapshots)
+        return categories
+
+    def __read_typed_store(self):
+        """
+        This function reads the whole snapshot store in chronological order and converts it to the declared
+        schema.
+        """
+        snapshots = schema.sort_snapshots(self.store.snapshots())
+        return schema.apply_schema(
+            self.store.load(snapshots=snapshots), self.store.categories()
+        )
+
+    def load_snapshots(self, snapshots, columns=None) -> list:
+        """
+        This function reads only the requested snapshots, and only the requested columns, of the raw data.
+
+        :param snapshots: The snapshot_date values to read
+        :param columns: The columns to read; every column is read when `None`, defaults to None
+        :return: A list with one DataFrame per snapshot, in the order of `snapshots`, converted to the
+        types declared in `schema`.
+        """
+        if self.__use_store():
+            variant = None if columns is None else tuple(columns)
+            categories = self.store.categories()
+            return [
+                dataset_cache.get_or_load(
+                    self.store.partition_path(snap),
+                    functools.partial(
+                        self.__read_typed_partition, snap, variant, categories
+                    ),
+                    variant=variant,
                 )
-            except Exception:
-                try:
-                    content = pd.read_excel(self.file_name)
-                    self.grab_logs.form_log(
-                        "Updated successfully",
-                        self.grab_logs.get_level("info"),
-                    )
-                except Exception as e:
-                    self.grab_logs.form_log(
-                        f"Update unsuccessful due to {e}",
-                        self.grab_logs.get_level("error"),
-                    )
-                    return None
+                for snap in snapshots
+            ]
+
+        df = self.update_df()
+        index = self.snapshot_index()
+        frames = [index.slice(df, snap) for snap in snapshots]
+        if columns is not None:
+            frames = [frame[list(columns)] for frame in frames]
+        return frames
+
+    def __read_typed_partition(self, snapshot, columns, categories):
+        """
+        This function reads one partition of the snapshot store and converts it to the declared schema,
+        using the categories of the whole store so separately read snapshots stay comparable.
+        """
+        return schema.apply_schema(
+            self.store.read_partition(snapshot, columns), categories
+        )
+
+    def export_raw_data(self):
+        """
+        This function writes the snapshot store back to the raw data workbook, keeping the store marked as
+        in sync with the new workbook so it is not imported again.
+        """
+        self.store.export_excel(self.file_name)
+        self.store.set_source_signature(dataset_cache.file_signature(self.file_name))
+        dataset_cache.invalidate(self.file_name)
+
+    def __use_store(self) -> bool:
+        """
+        This function decides if the snapshot store can serve the data, importing the workbook into it when
+        the store is missing or the workbook changed since the last import.
+
+        :return: `True` if the data should be read from the store, `False` if the workbook must be used.
+        """
+        if not self.store.available():
+            return False
+
+        signature = dataset_cache.file_signature(self.file_name)
+        if self.store.exists() and (
+            signature is None or self.store.source_signature() == list(signature)
+        ):
+            return True
+
+        content = dataset_cache.get_or_load(self.file_name, self.__read_source)
+        if content is None:
+            return self.store.exists()
+
+        try:
+            self.store.import_frame(content, signature)
+        except Exception as e:
+            self.grab_logs.form_log(
+                f"Snapshot store could not be built due to {e}",
+                self.grab_logs.get_level("error"),
+            )
+            return False
+
+        self.grab_logs.form_log(
+            f"{self.file_name} imported into the snapshot store",
+            self.grab_logs.get_level("info"),
+        )
+        return True
+
+    def __read_source(self):
+        """
+        This function parses the raw data file into a pandas DataFrame.
+
+        The format and encoding of the file are detected once by `loader.sniff`, and the matching reader
+        is called directly. Logs are recorded indicating success or failure.
+
+        :return: A pandas DataFrame containing the contents of the file specified by
+        `self.file_name`, or `None` if the file is empty or cannot be read.
+        """
+        try:
+            content = loader.read_table(self.file_name)
+        except Exception as e:
+            self.grab_logs.form_log(
+                f"Update unsuccessful due to {e}",
+                self.grab_logs.get_level("error"),
+            )
+            return None
+
+        if loader.sniff(self.file_name)[1] == "latin-1":
+            self.grab_logs.form_log(
+                "Content converted to Latin-1 due to encoding issues",
+                self.grab_logs.get_level("warn"),
+            )
 
         if content.empty:
             return None
@@ -80,20 +272,48 @@ class FilePrep:
 
     def _append_to_df(self, file_to_upload) -> pd.DataFrame:
         """
-        The function appends a new DataFrame to an existing DataFrame and then appends the combined
-        DataFrame to an Excel file.
+        The function ingests an uploaded DataFrame without rewriting the existing history.
+
+        Markets are assigned only to the incoming rows. Each snapshot_date found in the upload is then
+        written to its own partition of the snapshot store, with a manifest entry; rows for a snapshot that
+        already exists are merged into that single partition. Without a Parquet engine the incoming rows
+        are appended to the raw data workbook instead.
+
+        :param file_to_upload: The `file_to_upload` parameter is expected to be a pandas DataFrame with the
+        same layout as the raw data (without the "market" column, which is computed here)
+        :return: The incoming rows, with the "market" column assigned.
+        """
+        new_rows = self.asign_market(file_to_upload.copy())
+
+        try:
+            if self.__use_store():
+                self.__append_to_store(new_rows)
+            else:
+                self.__append_to_excel(new_rows)
+        finally:
+            # new categories may appear, so every cached partition is dropped, not only the new ones
+            dataset_cache.invalidate()
+
+        self.grab_logs.form_log(
+            f"{len(new_rows)} rows uploaded for {list(new_rows['snapshot_date'].unique())}",
+            self.grab_logs.get_level("info"),
+        )
+        return new_rows
 
-        :param file_to_upload: The `file_to_upload` parameter is expected to be a pandas DataFrame that you
-        want to append to an existing DataFrame. The function `_append_to_df` takes this DataFrame,
-        concatenates it with an existing DataFrame (`base_df`), and then appends the combined DataFrame to
-        an Excel file using the
-        :return: The method `_append_to_df` is returning the result of calling the private method
-        `__append_to_excel` with the new DataFrame `new_df` as an argument.
+    def __append_to_store(self, df_to_append: pd.DataFrame):
         """
-        base_df = self.update_df()
-        int_df = pd.concat([base_df, file_to_upload], ignore_index=True)
-        new_df = self.asign_market(int_df)
-        return self.__append_to_excel(new_df)
+        The function writes the uploaded rows to the snapshot store, one partition per snapshot_date.
+
+        :param df_to_append: The rows to ingest, with the "market" column already assigned
+        :type df_to_append: pd.DataFrame
+        """
+        known_snaps = set(self.store.snapshots())
+        for snapshot, part_df in df_to_append.groupby("snapshot_date", sort=False):
+            if snapshot in known_snaps:
+                part_df = pd.concat(
+                    [self.store.read_partition(snapshot), part_df], ignore_index=True
+                )
+            self.store.write_partition(part_df, snapshot)
 
     def __append_to_excel(self, df_to_append: pd.DataFrame):
         """
@@ -101,15 +321,18 @@ class FilePrep:
 
         :param df_to_append: The `df_to_append` parameter is a pandas DataFrame that contains the data you
         want to append to an existing Excel file. The function loads the existing Excel file, selects the
-        "data" sheet, appends the rows from the DataFrame to the sheet, and then saves and closes the
-        workbook
+        first sheet, appends the rows from the DataFrame to the sheet in the order of the sheet headers, and
+        then saves and closes the workbook
         :type df_to_append: pd.DataFrame
         """
         if os.path.isfile(self.file_name):
             workbook = load_workbook(self.file_name)
-            sheet = workbook["data"]
+            sheet = workbook.worksheets[0]
+            sheet_headers = [cell.value for cell in sheet[1]]
 
-            for row in dataframe_to_rows(df_to_append, header=False, index=False):
+            for row in dataframe_to_rows(
+                df_to_append.reindex(columns=sheet_headers), header=False, index=False
+            ):
                 sheet.append(row)
 
             workbook.save(self.file_name)
@@ -139,6 +362,9 @@ class FilePrep:
         """
         with open(self.file_name, "w") as file:
             pass
+        dataset_cache.invalidate(self.file_name)
+        if self.store.available():
+            self.store.clear(dataset_cache.file_signature(self.file_name))
         print("Data cleared on behalf of admin")
         self.grab_log.form_log(
             "Data Cleared on behalf of app admin", self.grab_logs.get_level("warn")
@@ -146,58 +372,46 @@ class FilePrep:
 
     def __snap_list(self):
         """
-        The function `__snap_list` retrieves unique snapshot dates from a DataFrame.
-        :return: The `snap_list` variable is being returned, which is a list of unique values from the
-        "snapshot_date" column in the `base_file` DataFrame.
+        The function `__snap_list` retrieves the snapshot dates of the raw data from the snapshot index.
+        :return: The list of unique "snapshot_date" values, sorted chronologically, so the last two are
+        always the previous and the actual quarter whatever the order of the rows.
         """
-        base_file = self.update_df()
-        try:
-            snap_list = list(base_file["snapshot_date"].unique())
-        except Exception:
-            snap_list = list(base_file["snapshot_date"].unique())
-        return snap_list
+        return self.snapshot_index().snapshots
 
     def map_quarters(self):
         """
-        The `map_quarters` function extracts quarter information based on month and year from a given list.
-        :return: The `map_quarters` method is returning the second and first elements of the `key_list` in
-        that order.
+        The `map_quarters` function extracts quarter information based on month and year of the last two
+        snapshots.
+        :return: The `map_quarters` method is returning the `(quarter, year)` of the actual and of the
+        previous snapshot, in that order.
         """
-        snap = last_quarters(self.__snap_list())
-        month = [val[:3] for val in snap]
-        year = [val[-2:] for val in snap]
-        q_list = get_quarter_month_list()
-        res = [
-            n[:3]
-            for key, values in q_list.items()
-            if key in ["Q1 20", "Q2 20", "Q3 20", "Q4 20"]
-            for n in values
-        ]
-        key_list = [
-            key
-            for key, values in q_list.items()
-            if key[3:] in year[0]
-            for vv in values
-            for valm in month
-            if valm in vv
-        ]
-        return key_list[1], key_list[0]
+        previous, actual = self.map_q()
+        return actual, previous
 
     def map_q(self):
         """
         The `map_q` function returns a list of quarters based on the previous quarters in a snapshot list.
-        :return: The `map_q` method returns a list of quarter values corresponding to the previous quarters
-        of the snapshots obtained from the `last_quarters` function.
+        :return: The `map_q` method returns a list of `(quarter, year)` tuples corresponding to the
+        snapshots obtained from the `last_quarters` function, labelled in one calendar lookup.
 
         0- previous quarter. 1- actual quarter
         """
         snap = last_quarters(self.__snap_list())
-        return [get_quarter_for_snap(x) for x in snap]
+        labels = quarter_calendar.default_calendar().label(
+            pd.Series(snap, dtype=object)
+        )
+        return [
+            None if quarter is None else (quarter, year)
+            for quarter, year in zip(labels["quarter"], labels["year"])
+        ]
 
-    @functools.lru_cache(maxsize=None)
-    def split_by_snap(self) -> tuple:
+    def split_by_snap(self, columns: tuple = None) -> tuple:
         """
         Splits the data into two DataFrames based on the most recent and previous quarters.
+        Only the two snapshots are read, and only `columns` when it is given.
+
+        Args:
+            columns: tuple - The columns to read; every column is read when `None`.
 
         Returns:
             tuple: A tuple containing two DataFrames.
@@ -206,9 +420,7 @@ class FilePrep:
             - The second DataFrame (index 1) represents data for the actual (most recent) quarter.
         """
         snap = last_quarters(self.__snap_list())  # will only contain 2 values
-        df = self.update_df()
-        dfprev = df[df["snapshot_date"] == snap[0]]
-        dfact = df[df["snapshot_date"] == snap[1]]
+        dfprev, dfact = self.load_snapshots(snap, columns)
         return (
             dfprev,
             dfact,
@@ -226,6 +438,7 @@ class FilePrep:
         """
         try:
             df_to_dump.to_excel(self.file_name, index=False)
+            dataset_cache.invalidate(self.file_name)
             self.grab_logs.form_log(
                 "New dataframe was dumped into the raw data file. Please consult backup file for additional checks",
                 self.grab_logs.get_level("warn"),
@@ -247,11 +460,9 @@ class FilePrep:
         named "market
         :type df: pd.DataFrame
         :return: The `asign_market` method is returning a DataFrame that is the result of assigning
-        continents to countries in the input DataFrame `df` based on the mapping provided by `c_map` and
-        then dumping the result into a new DataFrame using the `__dump_to_df` method.
+        continents to countries in the input DataFrame `df` based on the mapping provided by `c_map`.
         """
-        new_df = self.c_map.assign_continent(df, "country", "market")
-        return self.__dump_to_df(new_df)
+        return self.c_map.assign_continent(df, "country", "market")
 
 
 def repl_date():
@@ -303,16 +514,7 @@ def get_actual_q():
     This Python function retrieves the current quarter based on the current year and month.
     :return: The code is returning the current quarter based on the current year and month.
     """
-    c_year = datetime.now().year
-    date = datetime.now()
-    c_month = date.strftime("%b")
-    base = get_quarter_month_list()
-    for key, val in base.items():
-        if key in str(c_year):
-            for idx, x in val.items():
-                for mth in x:
-                    if c_month in mth:
-                        return idx
+    return quarter_calendar.default_calendar().quarter_of_date(datetime.now())[0]
 
 
 def get_quarter_for_snap(month_snap):
@@ -321,32 +523,32 @@ def get_quarter_for_snap(month_snap):
     abbreviation.
 
     :param month_snap: The function `get_quarter_for_snap` takes a parameter `month_snap`, which is a
-    string representing a month in the format "MMM-YY" (e.g., "Jan-22")
-    :return: the quarter corresponding to the given month_snap.
+    string representing a month in the format "Mon-YYYY" (e.g., "Jan-2024")
+    :return: the `(quarter, year)` corresponding to the given month_snap, or `None` if it can not be
+    parsed.
     """
-    q_list = get_quarter_month_list()
-    for key, val in q_list.items():
-        if key in month_snap:
-            for q, mth in val.items():
-                for m in mth:
-                    if month_snap[:3] in m:
-                        return q, key
+    return quarter_calendar.default_calendar().quarter_for_snap(month_snap)
 
 
 def add_quarter_for_snap2list(list_of_lists):
     """
     The function `add_quarter_for_snap2list` iterates through a list of lists and updates the second
-    element of each inner list with the quarter value obtained from a function `get_quarter_for_snap`.
+    element of each inner list with its `(quarter, year)`. All the snapshots are labelled in a single
+    calendar lookup.
 
-    :param list_of_lists: It seems like the code snippet you provided is incomplete.
+    :param list_of_lists: A list of mutable sequences whose second element is a "Mon-YYYY" snapshot date
     :return: The function `add_quarter_for_snap2list` is returning the `list_of_lists` after modifying
-    the second element of each sublist to contain the quarter obtained from the `get_quarter_for_snap`
-    function.
+    the second element of each sublist to contain its `(quarter, year)`, or `None` if the snapshot can
+    not be parsed.
     """
-    for val in list_of_lists:
-        for j, jval in enumerate(val):
-            if j == 1:
-                val[j] = get_quarter_for_snap(jval)
+    rows = [val for val in list_of_lists if len(val) > 1]
+    if not rows:
+        return list_of_lists
+    labels = quarter_calendar.default_calendar().label(
+        pd.Series([val[1] for val in rows], dtype=object)
+    )
+    for val, quarter, year in zip(rows, labels["quarter"], labels["year"]):
+        val[1] = None if quarter is None else (quarter, year)
     return list_of_lists
 
 
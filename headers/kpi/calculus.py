@@ -9,23 +9,97 @@ import numpy as np
 import pandas as pd
 
 
+def get_percentages(totals, margins) -> np.ndarray:
+    """
+    The function `get_percentages` calculates the share of `margins` in `totals` for whole arrays at once.
+
+    :param totals: An array (or Series) with the totals of every unit
+    :param margins: An array (or Series) with the part of each total looked at
+    :return: A float array with the percentages rounded to 2 decimals; units with a total of 0 get 0.
+    """
+    totals = np.asarray(totals, dtype=float)
+    margins = np.asarray(margins, dtype=float)
+    shares = np.divide(
+        margins,
+        totals,
+        out=np.zeros(np.broadcast(totals, margins).shape),
+        where=totals != 0,
+    )
+    return np.round(shares * 100, 2)
+
+
+def calculate_gap_percentages(values1, values2) -> np.ndarray:
+    """
+    The function `calculate_gap_percentages` calculates the relative gap between two arrays of values,
+    as a percentage of their mean.
+
+    :param values1: An array (or Series) of values
+    :param values2: An array (or Series) of values, or a single value to compare every unit with
+    :return: A float array with the gaps rounded to 2 decimals; pairs whose mean is 0 get 0.
+    """
+    values1 = np.asarray(values1, dtype=float)
+    values2 = np.asarray(values2, dtype=float)
+    means = (values1 + values2) / 2
+    gaps = np.divide(
+        np.abs(values1 - values2), means, out=np.zeros(means.shape), where=means != 0
+    )
+    return np.round(100 * gaps, 2)
+
+
+def calculate_gap_values(values1, values2) -> np.ndarray:
+    """
+    The function `calculate_gap_values` calculates the absolute difference between two arrays of values.
+
+    :param values1: An array (or Series) of values
+    :param values2: An array (or Series) of values
+    :return: An array with the absolute differences.
+    """
+    return np.abs(np.asarray(values1) - np.asarray(values2))
+
+
+def compare_progress_values(q_last, q_act) -> np.ndarray:
+    """
+    The function `compare_progress_values` calculates the progress between two arrays of quantities.
+
+    :param q_last: An array (or Series) with the last recorded values
+    :param q_act: An array (or Series) with the actual values
+    :return: A numeric array with `q_act - q_last`; use `format_progress` to display it.
+    """
+    return np.asarray(q_act) - np.asarray(q_last)
+
+
+def format_progress(progress) -> np.ndarray:
+    """
+    The function `format_progress` formats progress values for display, with an explicit plus sign for
+    growth (e.g. "+5", "-3", "0").
+
+    :param progress: An array (or Series) of progress values
+    :return: An array of strings.
+    """
+    progress = np.asarray(progress)
+    return np.array(
+        [f"+{val}" if val > 0 else str(val) for val in progress.ravel().tolist()],
+        dtype=object,
+    ).reshape(progress.shape)
+
+
 def get_percentage(total, margin):
-    return float(0) if total == 0 else round((margin / total) * 100, 2)
+    return float(get_percentages(total, margin))
 
 
 def calculate_gap_percentage(val1, val2):
-    return round(100 * (abs(val1 - val2) / ((val1 + val2) / 2)), 2)
+    return float(calculate_gap_percentages(val1, val2))
 
 
 def calculate_gap_value(val1, val2):
-    return abs(val1 - val2)
+    return calculate_gap_values(val1, val2).item()
 
 
 def compare_progress(q_last, q_act):
     """
     The function `compare_progress` compares two quantities and returns the difference between them with
     appropriate signs.
-    
+
     :param q_last: The `q_last` parameter represents the last recorded progress value
     :param q_act: The `q_act` parameter represents the actual progress made in a certain task or goal
     :return: The function `compare_progress` compares two quantities `q_last` and `q_act` and returns
@@ -33,10 +107,11 @@ def compare_progress(q_last, q_act):
     as a string with a plus sign (e.g., "+5"). If `q_last` is greater than `q_act`, it returns the
     negative difference. If they are equal, it
     """
-    if q_last < q_act:
-        return f"+{q_act-q_last}"
-    elif q_act < q_last:
-        return q_act - q_last
+    progress = compare_progress_values(q_last, q_act).item()
+    if progress > 0:
+        return format_progress(progress).item()
+    elif progress < 0:
+        return progress
     else:
         return "0"
 
@@ -1,6 +1,141 @@
-import xlwings as xw
+"""
+@package docstring
+
+This file defines the cell styles of the reports.
+Every style is described once, independently of the report writer, as a named format (fill colour,
+bold white text, borders). XlsxWriter turns it into a workbook format and Excel registers it as a
+workbook style, so a header or a whole table is styled with a single write instead of one call per
+property and per border.
+
+"""
+
 import pandas as pd
 
+WHITE = (255, 255, 255)
+
+# "css_class" is the class of the same style in headers/kpi/style_doc.html, used by the HTML reports
+STYLES = {
+    "header": {
+        "fill": (112, 48, 160),
+        "bold": True,
+        "font_color": WHITE,
+        "css_class": "header-text-look",
+    },
+    "header2": {
+        "fill": (47, 117, 181),
+        "bold": True,
+        "font_color": WHITE,
+        "css_class": "header2-text-look",
+    },
+    "header3": {
+        "fill": (0, 176, 80),
+        "bold": True,
+        "font_color": WHITE,
+        "css_class": "header3-text-look",
+    },
+    "ci_count": {
+        "fill": (0, 112, 192),
+        "bold": True,
+        "font_color": WHITE,
+        "css_class": "ci-count-style",
+    },
+    "ci_header": {
+        "fill": (68, 84, 106),
+        "bold": True,
+        "font_color": WHITE,
+        "css_class": "adaptive-ci-header-style",
+    },
+    "table": {"border": 1, "css_class": "bordered"},
+}
+
+# prefix of the workbook styles registered in Excel, so they do not clash with the built-in ones
+EXCEL_STYLE_PREFIX = "QvQ "
+
+
+def _hex_color(color) -> str:
+    red, green, blue = color
+    return f"#{red:02X}{green:02X}{blue:02X}"
+
+
+def _bgr_color(color) -> int:
+    # Excel stores RGB colours as a BGR integer
+    red, green, blue = color
+    return red + green * 256 + blue * 256 * 256
+
+
+def xlsx_format(*names) -> dict:
+    """
+    The function `xlsx_format` combines named styles into the properties of an XlsxWriter format.
+
+    :param names: The names of the styles in `STYLES`, applied in order
+    :return: A dictionary to pass to `workbook.add_format`.
+    :raises KeyError: If a style is unknown.
+    """
+    properties = {}
+    for name in names:
+        style = STYLES[name]
+        if "fill" in style:
+            properties["bg_color"] = _hex_color(style["fill"])
+        if "bold" in style:
+            properties["bold"] = style["bold"]
+        if "font_color" in style:
+            properties["font_color"] = _hex_color(style["font_color"])
+        if "border" in style:
+            properties["border"] = style["border"]
+    return properties
+
+
+def register_styles(book) -> None:
+    """
+    The function `register_styles` adds every style of `STYLES` to the styles of an Excel workbook.
+    Styles already registered are left untouched.
+
+    :param book: The xlwings workbook
+    """
+    for name, style in STYLES.items():
+        excel_name = EXCEL_STYLE_PREFIX + name
+        try:
+            book.api.Styles(excel_name)
+            continue
+        except Exception:
+            excel_style = book.api.Styles.Add(excel_name)
+
+        # the style only carries the properties it defines, the cells keep their number format
+        excel_style.IncludeNumber = False
+        excel_style.IncludeAlignment = False
+        excel_style.IncludeProtection = False
+        excel_style.IncludePatterns = "fill" in style
+        excel_style.IncludeFont = "bold" in style or "font_color" in style
+        excel_style.IncludeBorder = "border" in style
+        if "fill" in style:
+            excel_style.Interior.Color = _bgr_color(style["fill"])
+        if "bold" in style:
+            excel_style.Font.Bold = style["bold"]
+        if "font_color" in style:
+            excel_style.Font.Color = _bgr_color(style["font_color"])
+        if "border" in style:
+            excel_style.Borders.LineStyle = 1
+            excel_style.Borders.Weight = 2
+
+
+def apply_style(cell_range, name) -> None:
+    """
+    The function `apply_style` applies a named style to a whole range with a single call, registering
+    the styles of the workbook the first time.
+
+    :param cell_range: The xlwings range to style
+    :param name: The name of the style in `STYLES`
+    :raises KeyError: If the style is unknown.
+    """
+    if name not in STYLES:
+        raise KeyError(name)
+    excel_name = EXCEL_STYLE_PREFIX + name
+    try:
+        cell_range.api.Style = excel_name
+    except Exception:
+        register_styles(cell_range.sheet.book)
+        cell_range.api.Style = excel_name
+
 
 def header_text_look(worksheet1, arg1):
     """
@@ -18,9 +153,7 @@ def header_text_look(worksheet1, arg1):
     >>> ws = wb.sheets['Sheet1']
     >>> header_text_look(ws, 'A1')
     """
-    worksheet1[arg1].color = (112, 48, 160)
-    worksheet1.range(arg1).api.Font.Bold = True
-    worksheet1.range(arg1).api.Font.ColorIndex = 2
+    apply_style(worksheet1.range(arg1), "header")
 
 
 def header2_text_look(worksheet1, arg1):
@@ -39,9 +172,7 @@ def header2_text_look(worksheet1, arg1):
     >>> ws = wb.sheets['Sheet1']
     >>> header2_text_look(ws, 'A1')
     """
-    worksheet1[arg1].color = (47, 117, 181)
-    worksheet1.range(arg1).api.Font.Bold = True
-    worksheet1.range(arg1).api.Font.ColorIndex = 2
+    apply_style(worksheet1.range(arg1), "header2")
 
 
 def header3_text_look(worksheet1, arg1):
@@ -60,9 +191,7 @@ def header3_text_look(worksheet1, arg1):
     >>> ws = wb.sheets['Sheet1']
     >>> header3_text_look(ws, 'A1')
     """
-    worksheet1[arg1].color = (0, 176, 80)
-    worksheet1.range(arg1).api.Font.Bold = True
-    worksheet1.range(arg1).api.Font.ColorIndex = 2
+    apply_style(worksheet1.range(arg1), "header3")
 
 
 def adaptive_header1_style(worksheet1, arg1):
@@ -81,9 +210,7 @@ def adaptive_header1_style(worksheet1, arg1):
     >>> ws = wb.sheets['Sheet1']
     >>> adaptive_header1_style(ws, (1, 1))
     """
-    worksheet1[arg1[1] - 1, arg1[0] - 1].color = (112, 48, 160)
-    worksheet1[arg1[1] - 1, arg1[0] - 1].api.Font.Bold = True
-    worksheet1[arg1[1] - 1, arg1[0] - 1].api.Font.ColorIndex = 2
+    apply_style(worksheet1[arg1[1] - 1, arg1[0] - 1], "header")
 
 
 def ci_count_style(worksheet1, arg1):
@@ -102,9 +229,7 @@ def ci_count_style(worksheet1, arg1):
     >>> ws = wb.sheets['Sheet1']
     >>> ci_count_style(ws, (1, 1))
     """
-    worksheet1[arg1[1] - 1, arg1[0] - 1].color = (0, 112, 192)
-    worksheet1[arg1[1] - 1, arg1[0] - 1].api.Font.Bold = True
-    worksheet1[arg1[1] - 1, arg1[0] - 1].api.Font.ColorIndex = 2
+    apply_style(worksheet1[arg1[1] - 1, arg1[0] - 1], "ci_count")
 
 
 def adaptive_header2_style(worksheet1, arg_list):
@@ -123,9 +248,7 @@ def adaptive_header2_style(worksheet1, arg_list):
     >>> ws = wb.sheets['Sheet1']
     >>> adaptive_header2_style(ws, [1, 1])
     """
-    worksheet1[arg_list[1] - 1, arg_list[0] - 1].color = (47, 117, 181)
-    worksheet1[arg_list[1] - 1, arg_list[0] - 1].api.Font.Bold = True
-    worksheet1[arg_list[1] - 1, arg_list[0] - 1].api.Font.ColorIndex = 2
+    apply_style(worksheet1[arg_list[1] - 1, arg_list[0] - 1], "header2")
 
 
 def adaptive_header3_style(worksheet1, arg_list):
@@ -144,9 +267,7 @@ def adaptive_header3_style(worksheet1, arg_list):
     >>> ws = wb.sheets['Sheet1']
     >>> adaptive_header3_style(ws, [1, 1])
     """
-    worksheet1[arg_list[1] - 1, arg_list[0] - 1].color = (0, 176, 80)
-    worksheet1[arg_list[1] - 1, arg_list[0] - 1].api.Font.Bold = True
-    worksheet1[arg_list[1] - 1, arg_list[0] - 1].api.Font.ColorIndex = 2
+    apply_style(worksheet1[arg_list[1] - 1, arg_list[0] - 1], "header3")
 
 
 def adaptive_ci_header_style(worksheet1, arg_list):
@@ -165,9 +286,7 @@ def adaptive_ci_header_style(worksheet1, arg_list):
     >>> ws = wb.sheets['Sheet1']
     >>> adaptive_ci_header_style(ws, [1, 1])
     """
-    worksheet1[arg_list[1] - 1, arg_list[0] - 1].color = (68, 84, 106)
-    worksheet1[arg_list[1] - 1, arg_list[0] - 1].api.Font.Bold = True
-    worksheet1[arg_list[1] - 1, arg_list[0] - 1].api.Font.ColorIndex = 2
+    apply_style(worksheet1[arg_list[1] - 1, arg_list[0] - 1], "ci_header")
 
 
 def write_dataframe_with_borders(ws, cell, df):
@@ -177,16 +296,4 @@ def write_dataframe_with_borders(ws, cell, df):
     last_row = ws[cell].row + df.shape[0] - 1
     last_col = ws[cell].column + df.shape[1] - 2
     data_range = ws.range(ws[cell].address, ws[last_row, last_col].address)
-
-    border_types = {
-        "left": 1,
-        "right": 2,
-        "top": 3,
-        "bottom": 4,
-        "inside_horizontal": 12,
-        "inside_vertical": 11,
-    }
-
-    for border_position in border_types.values():
-        data_range.api.Borders(border_position).LineStyle = 1
-        data_range.api.Borders(border_position).Weight = 2
+    apply_style(data_range, "table")
@@ -0,0 +1,232 @@
+"""
+@package docstring
+
+This package is responsible with aggregating the headcount needed by every kpi in a single pass.
+The cube holds the number of employees per snapshot, department, market, band and gender; every kpi
+table is then a lookup on this small aggregate instead of a scan of the raw data. The department x market
+cross-tab of the cube serves the linked department and market views of the app.
+
+"""
+
+import threading
+import weakref
+import pandas as pd
+from . import calculus
+from .. import pay_grades
+
+CUBE_DIMENSIONS = ("snapshot_date", "department", "market", "band", "gender")
+MANAGEMENT_TYPES = ["LM", "UM"]
+LINKED_DIMENSIONS = {"department": "market", "market": "department"}
+
+_cubes = {}
+_cubes_lock = threading.Lock()
+
+
+class KpiCube:
+    def __init__(self, df):
+        frame = pay_grades.with_ordinals(df)
+        keys = {dim: frame[dim] for dim in CUBE_DIMENSIONS if dim in frame.columns}
+        keys["band"] = pay_grades.band_of(frame[pay_grades.ORDINAL_COLUMN])
+        self.dimensions = [dim for dim in CUBE_DIMENSIONS if dim in keys]
+
+        counts = (
+            frame["employee_id"]
+            .groupby(
+                [keys[dim] for dim in self.dimensions], observed=True, dropna=False
+            )
+            .count()
+        )
+        counts.index.names = self.dimensions
+        self.table = counts.rename("headcount").reset_index()
+        self._crosstab = None
+
+    @classmethod
+    def for_frame(cls, df):
+        """
+        The function `for_frame` returns the cube of a DataFrame, building it only the first time it is
+        asked for. The cube is dropped together with the DataFrame.
+
+        :param df: A raw data like DataFrame
+        :return: The `KpiCube` of `df`.
+        """
+        key = id(df)
+        with _cubes_lock:
+            entry = _cubes.get(key)
+            if entry is not None and entry[0]() is df:
+                return entry[1]
+
+        cube = cls(df)
+        with _cubes_lock:
+            _cubes[key] = (
+                weakref.ref(df, lambda _, key=key: _cubes.pop(key, None)),
+                cube,
+            )
+        return cube
+
+    def select(self, **filters) -> pd.DataFrame:
+        """
+        The function `select` returns the cells of the cube matching every filter.
+
+        :param filters: One keyword per dimension, e.g. `department="Sales", band="UM"`
+        :return: The matching rows of the cube.
+        """
+        mask = pd.Series(True, index=self.table.index)
+        for dim, value in filters.items():
+            mask &= self.table[dim] == value
+        return self.table.loc[mask]
+
+    def headcount(self, **filters) -> int:
+        """
+        The function `headcount` counts the employees matching every filter.
+
+        :param filters: One keyword per dimension, e.g. `market="Europe", gender="Female"`
+        :return: The number of employees.
+        """
+        return int(self.select(**filters)["headcount"].sum())
+
+    def market_counts(self, department, band="UM") -> pd.DataFrame:
+        """
+        The function `market_counts` splits the headcount of a department and band per market.
+        When the band is empty, every market of the department is listed with a count of 0.
+
+        :param department: The department looked at
+        :param band: The band looked at, defaults to "UM"
+        :return: A DataFrame with the columns "market" and "employee_id" (the headcount).
+        """
+        in_band = self.select(department=department, band=band)
+        if in_band.empty:
+            all_markets_in_dept = self.select(department=department)["market"].unique()
+            return pd.DataFrame(
+                {
+                    "market": all_markets_in_dept,
+                    "employee_id": [0] * len(all_markets_in_dept),
+                }
+            )
+
+        return (
+            in_band.groupby("market", observed=True)["headcount"]
+            .sum()
+            .reset_index(name="employee_id")
+        )
+
+    def gap_table(self, column, values=None, ambition=45) -> pd.DataFrame:
+        """
+        The function `gap_table` builds the gender gap table of the LM and UM bands for many departments
+        or markets at once, with a single vectorized calculation.
+
+        :param column: The dimension looked at, "department" or "market"
+        :param values: The departments or markets looked at; every one in the cube when `None`,
+        defaults to None
+        :param ambition: The target share of women, in percent, defaults to 45
+        :return: A DataFrame with the columns `column`, "Management", "Total Employees",
+        "From which Women", "Ambition", "Gap %" and "Gap #", two rows per unit.
+        """
+        cells = self.table
+        if values is None:
+            values = cells[column].dropna().unique()
+        else:
+            cells = cells.loc[cells[column].isin(values)]
+
+        index = pd.MultiIndex.from_product(
+            [list(values), MANAGEMENT_TYPES], names=[column, "band"]
+        )
+        total_employees = (
+            cells.groupby([column, "band"], observed=True)["headcount"]
+            .sum()
+            .reindex(index, fill_value=0)
+        )
+        women_employees = (
+            cells.loc[cells["gender"] == "Female"]
+            .groupby([column, "band"], observed=True)["headcount"]
+            .sum()
+            .reindex(index, fill_value=0)
+        )
+
+        data = {
+            column: index.get_level_values(column),
+            "Management": index.get_level_values("band"),
+            **_gap_columns(total_employees, women_employees, ambition),
+        }
+
+        return pd.DataFrame(data=data)
+
+    def crosstab(self) -> pd.DataFrame:
+        """
+        The function `crosstab` returns the headcount per department and market (rows) and per band and
+        gender (columns), over every snapshot of the cube. It is built the first time it is asked for.
+
+        :return: A DataFrame indexed by ("department", "market") with ("band", "gender") columns.
+        """
+        if self._crosstab is None:
+            self._crosstab = self.table.pivot_table(
+                index=["department", "market"],
+                columns=["band", "gender"],
+                values="headcount",
+                aggfunc="sum",
+                fill_value=0,
+                observed=True,
+            )
+        return self._crosstab
+
+    def linked_form_df(self, column, value, linked=None, ambition=45) -> pd.DataFrame:
+        """
+        The function `linked_form_df` builds the gender gap table of the LM and UM bands for one
+        department or market, optionally restricted to one market or department, from the cross-tab.
+
+        :param column: The dimension looked at, "department" or "market"
+        :param value: The department or market looked at
+        :param linked: The market (when `column` is "department") or department (when `column` is
+        "market") the table is restricted to; every one when `None`, defaults to None
+        :param ambition: The target share of women, in percent, defaults to 45
+        :return: A DataFrame with the same columns as `form_df`.
+        """
+        crosstab = self.crosstab()
+        cells = crosstab.loc[crosstab.index.get_level_values(column) == value]
+        if linked is not None:
+            other = LINKED_DIMENSIONS[column]
+            cells = cells.loc[cells.index.get_level_values(other) == linked]
+
+        counts = cells.sum()
+        bands = counts.index.get_level_values("band").astype(str)
+        genders = counts.index.get_level_values("gender").astype(str)
+        index = pd.Index(MANAGEMENT_TYPES, name="band")
+        total_employees = (
+            counts.groupby(bands).sum().reindex(index, fill_value=0).astype(int)
+        )
+        women_employees = (
+            counts[genders == "Female"]
+            .groupby(bands[genders == "Female"])
+            .sum()
+            .reindex(index, fill_value=0)
+            .astype(int)
+        )
+
+        data = {
+            "Management": MANAGEMENT_TYPES,
+            **_gap_columns(total_employees, women_employees, ambition),
+        }
+        return pd.DataFrame(data=data)
+
+    def form_df(self, column, value, ambition=45) -> pd.DataFrame:
+        """
+        The function `form_df` builds the gender gap table of the LM and UM bands for one department or
+        market.
+
+        :param column: The dimension looked at, "department" or "market"
+        :param value: The department or market looked at
+        :param ambition: The target share of women, in percent, defaults to 45
+        :return: A DataFrame with the columns "Management", "Total Employees", "From which Women",
+        "Ambition", "Gap %" and "Gap #".
+        """
+        return self.gap_table(column, [value], ambition).drop(columns=column)
+
+
+def _gap_columns(total_employees, women_employees, ambition) -> dict:
+    women_percentages = calculus.get_percentages(total_employees, women_employees)
+    return {
+        "Total Employees": total_employees.to_numpy(),
+        "From which Women": women_employees.to_numpy(),
+        "Ambition": f"{ambition}%",
+        "Gap %": calculus.calculate_gap_percentages(women_percentages, ambition),
+        "Gap #": calculus.calculate_gap_values(women_employees, total_employees),
+    }
@@ -5,18 +5,17 @@ This package is responsible with calculating the kpi needed for the reports
 
 """
 
-import pandas as pd
-from .. import file_ops
-from .. import consolidate
-from . import calculus
+from .. import pay_grades
+from . import kpi_cube
 
 
 class EmployeeAnalytics:
     def __init__(self, df, cval):
-        self.df = df
+        self.df = pay_grades.with_ordinals(df)
         self.cval = cval
-        self.UM = ["G37", "G38", "G39", "G40", "G41"]
-        self.LM = ["G34", "G35", "G36"]
+        self.UM = pay_grades.band_grades("UM")
+        self.LM = pay_grades.band_grades("LM")
+        self.cube = kpi_cube.KpiCube.for_frame(df)
 
     def get_women_combo(self):
         """
@@ -24,10 +23,7 @@ class EmployeeAnalytics:
         :return: The `get_women_combo` method is returning the count of female employees in the DataFrame
         `df` where the department matches the value stored in `self.cval`.
         """
-        return self.df.loc[
-            (self.df["department"] == self.cval) & (self.df["gender"] == "Female"),
-            "employee_id",
-        ].count()
+        return self.cube.headcount(department=self.cval, gender="Female")
 
     def get_woman_lm(self):
         """
@@ -36,27 +32,17 @@ class EmployeeAnalytics:
         :return: The `get_woman_lm` method is returning the count of female employees with pay grades G34,
         G35, or G36 in the specified department (`self.cval`).
         """
-        return self.df.loc[
-            (self.df["pay_grade"].isin(self.LM))
-            & (self.df["department"] == self.cval)
-            & (self.df["gender"] == "Female"),
-            "employee_id",
-        ].count()
+        return self.cube.headcount(department=self.cval, band="LM", gender="Female")
 
     def get_woman_um(self):
         """
         This Python function returns the count of female employees in a specific department with pay
         grades G37 to G41.
         :return: The `get_woman_um` method is returning the count of female employees in the DataFrame
-        `self.df` where the pay grade is in the specified list ["G37", "G38", "G39", "G40", "G41"], the
+        `self.df` where the pay grade is in the UM band (G37 to G41 by default), the
         department matches the value stored in `self.cval`, and the gender is "Female".
         """
-        return self.df.loc[
-            (self.df["pay_grade"].isin(self.UM))
-            & (self.df["department"] == self.cval)
-            & (self.df["gender"] == "Female"),
-            "employee_id",
-        ].count()
+        return self.cube.headcount(department=self.cval, band="UM", gender="Female")
 
     def get_total_employees_combo(self):
         """
@@ -65,7 +51,7 @@ class EmployeeAnalytics:
         :return: The `get_total_employees_combo` method is returning the total count of employees in the
         DataFrame `df` where the department column matches the value stored in `cval`.
         """
-        return self.df.loc[self.df["department"] == self.cval, "employee_id"].count()
+        return self.cube.headcount(department=self.cval)
 
     def get_total_employees_lm(self):
         """
@@ -74,10 +60,7 @@ class EmployeeAnalytics:
         :return: The `get_total_employees_lm` method is returning the count of employees whose pay grade is
         in self.LM and who belong to the department specified by `self.cval`.
         """
-        return self.df.loc[
-            (self.df["pay_grade"].isin(self.LM)) & (self.df["department"] == self.cval),
-            "employee_id",
-        ].count()
+        return self.cube.headcount(department=self.cval, band="LM")
 
     def get_total_employees_um(self):
         """
@@ -86,46 +69,20 @@ class EmployeeAnalytics:
         :return: The `get_total_employees_um` method is returning the count of employees who belong to pay
         grades G37, G38, G39, G40, or G41 and are in the department specified by `self.cval`.
         """
-        return self.df.loc[
-            (self.df["pay_grade"].isin(self.UM)) & (self.df["department"] == self.cval),
-            "employee_id",
-        ].count()
+        return self.cube.headcount(department=self.cval, band="UM")
 
     def get_market_UM_by_dpt(self):
-        filtered_df = self.df.loc[
-            (self.df["department"] == self.cval) & (self.df["pay_grade"].isin(self.UM)),
-            ["market"],
-        ]
-
-        if filtered_df.empty:
-            all_markets_in_dept = self.df.loc[
-                self.df["department"] == self.cval, "market"
-            ].unique()
-
-            empty_market_counts = pd.DataFrame(
-                {
-                    "market": all_markets_in_dept,
-                    "employee_id": [0] * len(all_markets_in_dept),
-                }
-            )
-
-            return empty_market_counts.reset_index(drop=True)
-
-        market_counts = (
-            filtered_df.groupby("market").size().reset_index(name="employee_id")
-        )
-
-        market_counts = market_counts.reset_index(drop=True)
-
-        return market_counts
+        return self.cube.market_counts(self.cval, "UM")
 
     def get_actual_population(self):
-        return self.df.loc[self.df["department"] == self.cval]
+        return self.df.loc[self.df["department"] == self.cval].drop(
+            columns=pay_grades.ORDINAL_COLUMN, errors="ignore"
+        )
 
     def get_um_members_w_data(self):
         df = self.get_actual_population()
         return df.loc[
-            (self.df["pay_grade"].isin(self.UM)),
+            pay_grades.band_mask(self.df, "UM"),
             ["first_name", "last_name", "gender", "market", "pay_grade"],
         ]
 
@@ -135,37 +92,6 @@ class EmployeeAnalytics:
     def form_df(self):
         """
         The `form_df` function calculates gender pay gap percentages and values for different management
-        types.
+        types, from the kpi cube of the DataFrame.
         """
-        management_types = ["LM", "UM"]
-        total_employees = [
-            self.get_total_employees_lm(),
-            self.get_total_employees_um(),
-        ]
-        women_employees = [self.get_woman_lm(), self.get_woman_um()]
-        ambition = "45%"
-
-        gap_percentages = [
-            calculus.calculate_gap_percentage(
-                calculus.get_percentage(total_employees[0], women_employees[0]), 45
-            ),
-            calculus.calculate_gap_percentage(
-                calculus.get_percentage(total_employees[1], women_employees[1]), 45
-            ),
-        ]
-
-        gap_numbers = [
-            calculus.calculate_gap_value(women_employees[0], total_employees[0]),
-            calculus.calculate_gap_value(women_employees[1], total_employees[1]),
-        ]
-
-        data = {
-            "Management": management_types,
-            "Total Employees": total_employees,
-            "From which Women": women_employees,
-            "Ambition": [ambition, ambition],
-            "Gap %": gap_percentages,
-            "Gap #": gap_numbers,
-        }
-
-        return pd.DataFrame(data=data)
+        return self.cube.form_df("department", self.cval)
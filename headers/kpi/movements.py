@@ -1,196 +1,603 @@
+import threading
+import weakref
+import numpy as np
 import pandas as pd
+from .. import pay_grades
+from .. import schema
+from . import calculus
+
+# movement classes, in the order they are listed in the report
+TERMINATION = "Termination"
+HIRE = "Hire"
+LATERAL_IN = "Lateral Movement In"
+LATERAL_OUT = "Lateral Movement Out"
+PROMOTION = "Promotion"
+DEMOTION = "Demotion"
+LATERAL_IN_PROMOTION = "Lateral In with Promotion"
+LATERAL_IN_DEMOTION = "Lateral In with Demotion"
+LATERAL_OUT_PROMOTION = "Lateral Out with Promotion"
+LATERAL_OUT_DEMOTION = "Lateral Out with Demotion"
+NO_MOVEMENT = "No Movement"
+
+MOVEMENT_CLASSES = [
+    TERMINATION,
+    HIRE,
+    LATERAL_IN,
+    LATERAL_OUT,
+    PROMOTION,
+    DEMOTION,
+    LATERAL_IN_PROMOTION,
+    LATERAL_IN_DEMOTION,
+    LATERAL_OUT_PROMOTION,
+    LATERAL_OUT_DEMOTION,
+    NO_MOVEMENT,
+]
+INFLOW_CLASSES = [HIRE, LATERAL_IN, LATERAL_IN_PROMOTION, LATERAL_IN_DEMOTION]
+OUTFLOW_CLASSES = [
+    TERMINATION,
+    LATERAL_OUT,
+    LATERAL_OUT_PROMOTION,
+    LATERAL_OUT_DEMOTION,
+]
+# the employee is described by the last snapshot for these classes, by the actual one otherwise
+LEAVING_CLASSES = OUTFLOW_CLASSES
+
+MOVEMENT_COLUMNS = [
+    "first_name",
+    "last_name",
+    "gender",
+    "pay_grade",
+    "department",
+    "market",
+]
+
+# columns of the movement matrix
+FROM_COLUMN = "from_department"
+TO_COLUMN = "to_department"
+
+# dimensions whose populations are reconciled with the movements
+RECONCILE_DIMENSIONS = ("department", "market")
+RECONCILE_COLUMNS = [
+    "Dimension",
+    "Unit",
+    "Measure",
+    "Last_q population",
+    "Outflow",
+    "Inflow",
+    "Expected",
+    "Actual_q population",
+    "Difference",
+    "Employee IDs",
+    "Issues",
+]
+DUPLICATED_LAST = "duplicated in the last snapshot"
+DUPLICATED_ACTUAL = "duplicated in the actual snapshot"
+SEVERAL_MOVEMENTS = "counted in several movements"
+CHANGED_GENDER = "gender changed between the snapshots"
+
+_matrices = {}
+_matrices_lock = threading.Lock()
+
+
+def _columns(department_col, employee_id_col):
+    columns = [employee_id_col] + MOVEMENT_COLUMNS
+    if department_col not in columns:
+        columns.append(department_col)
+    return columns
+
+
+def join_snapshots(
+    last_q_df, actual_q_df, department_col="department", employee_id_col="employee_id"
+):
+    # one full outer join carrying only the columns the movements need; the row positions
+    # keep track of which side each row comes from and of the original row order
+    def side(df):
+        columns = _columns(department_col, employee_id_col) + [
+            pay_grades.ORDINAL_COLUMN
+        ]
+        df = pay_grades.with_ordinals(df[[col for col in columns if col in df.columns]])
+        return df.assign(_pos=np.arange(len(df)))
 
+    return pd.merge(
+        side(last_q_df),
+        side(actual_q_df),
+        on=[employee_id_col],
+        how="outer",
+        suffixes=("_last", "_current"),
+    )
 
-class EmployeeMovements:
+
+def _populations(df, department_col):
+    females = (df["gender"] == "Female").groupby(df[department_col], observed=True)
+    return females.agg(["size", "sum"]).set_axis(["total", "female"], axis=1)
+
+
+class MovementMatrix:
     def __init__(
         self,
         last_q_df,
         actual_q_df,
-        department,
         department_col="department",
         employee_id_col="employee_id",
     ):
-        self.last_q_df = last_q_df[last_q_df[department_col] == department]
-        self.actual_q_df = actual_q_df[actual_q_df[department_col] == department]
-        self.department = department
         self.department_col = department_col
         self.employee_id_col = employee_id_col
+        self.joined = join_snapshots(
+            last_q_df, actual_q_df, department_col, employee_id_col
+        )
+        self.table = self._transitions()
+        self.unit_populations = {
+            dim: pd.concat(
+                {
+                    "last": _populations(last_q_df, dim),
+                    "actual": _populations(actual_q_df, dim),
+                },
+                axis=1,
+            ).fillna(0)
+            for dim in dict.fromkeys((department_col,) + RECONCILE_DIMENSIONS)
+            if dim in last_q_df.columns and dim in actual_q_df.columns
+        }
+        self.populations = self.unit_populations[department_col]
+        self._rows = self._department_rows()
+        self._reconciliation = None
 
-        self.last_q_ids = set(self.last_q_df[self.employee_id_col])
-        self.actual_q_ids = set(self.actual_q_df[self.employee_id_col])
+    @classmethod
+    def for_pair(
+        cls,
+        last_q_df,
+        actual_q_df,
+        department_col="department",
+        employee_id_col="employee_id",
+    ):
+        """
+        The function `for_pair` returns the movement matrix of two snapshots, building it only the first
+        time it is asked for. The matrix is dropped together with either snapshot.
+
+        :param last_q_df: The rows of the previous snapshot
+        :param actual_q_df: The rows of the actual snapshot
+        :return: The `MovementMatrix` of the pair.
+        """
+        key = (id(last_q_df), id(actual_q_df), department_col, employee_id_col)
+        with _matrices_lock:
+            entry = _matrices.get(key)
+            if (
+                entry is not None
+                and entry[0]() is last_q_df
+                and entry[1]() is actual_q_df
+            ):
+                return entry[2]
+
+        matrix = cls(last_q_df, actual_q_df, department_col, employee_id_col)
+
+        def drop(_, key=key):
+            _matrices.pop(key, None)
+
+        with _matrices_lock:
+            _matrices[key] = (
+                weakref.ref(last_q_df, drop),
+                weakref.ref(actual_q_df, drop),
+                matrix,
+            )
+        return matrix
+
+    def _counted_rows(self):
+        # every row of the previous snapshot is counted once (with its first match), and every hire
+        in_last = self.joined["_pos_last"].notna()
+        return self.joined.loc[~in_last | ~self.joined["_pos_last"].duplicated()]
+
+    def _transitions(self):
+        rows = self._counted_rows()
+        in_last = rows["_pos_last"].notna()
+        in_current = rows["_pos_current"].notna()
+
+        keys = [
+            rows[self.department_col + "_last"]
+            .astype(object)
+            .where(in_last, HIRE)
+            .rename(FROM_COLUMN),
+            rows[self.department_col + "_current"]
+            .astype(object)
+            .where(in_current, TERMINATION)
+            .rename(TO_COLUMN),
+            rows["gender_last"]
+            .astype(object)
+            .where(in_last, rows["gender_current"].astype(object))
+            .rename("gender"),
+            pay_grades.band_of(rows[pay_grades.ORDINAL_COLUMN + "_last"]).rename(
+                "from_band"
+            ),
+            pay_grades.band_of(rows[pay_grades.ORDINAL_COLUMN + "_current"]).rename(
+                "to_band"
+            ),
+        ]
+        return (
+            rows[self.employee_id_col]
+            .groupby(keys, observed=True, dropna=False)
+            .size()
+            .rename("headcount")
+            .reset_index()
+        )
 
-    def _merge_dataframes(self, df1, df2, on_cols, how="outer"):
-        return pd.merge(df1, df2, on=on_cols, how=how, suffixes=("_last", "_current"))
+    def _department_rows(self):
+        joined = self.joined
+        last_rows = joined.groupby(self.department_col + "_last", observed=True).indices
+        current_rows = joined.groupby(
+            self.department_col + "_current", observed=True
+        ).indices
+        empty = np.array([], dtype=np.int64)
+        return {
+            department: np.union1d(
+                last_rows.get(department, empty), current_rows.get(department, empty)
+            )
+            for department in set(last_rows) | set(current_rows)
+        }
 
-    def _calculate_population(self, df):
-        total_population = len(df)
-        female_population = df[df["gender"] == "Female"].shape[0]
-        return total_population, female_population
+    def rows_of(self, department):
+        """
+        The function `rows_of` returns the joined rows of the employees that were or are in a department.
+
+        :param department: The department looked at
+        :return: A slice of the joined snapshots.
+        """
+        positions = self._rows.get(department, np.array([], dtype=np.int64))
+        return self.joined.iloc[positions]
+
+    def _flow(self, mask):
+        cells = self.table.loc[mask]
+        female = cells.loc[cells["gender"] == "Female", "headcount"].sum()
+        return int(cells["headcount"].sum()), int(female)
+
+    def inflow(self, department):
+        """
+        The function `inflow` counts the hires and lateral moves into a department.
+
+        :param department: The department looked at
+        :return: A `(total, female)` tuple.
+        """
+        return self._flow(
+            (self.table[TO_COLUMN] == department)
+            & (self.table[FROM_COLUMN] != department)
+        )
 
-    def get_terminations(self):
-        terminated_ids = self.last_q_ids - self.actual_q_ids
-        terminations = self.last_q_df[
-            self.last_q_df[self.employee_id_col].isin(terminated_ids)
-        ]
-        terminations["reason"] = "Termination"
-        return terminations
+    def outflow(self, department):
+        """
+        The function `outflow` counts the terminations and lateral moves out of a department.
 
-    def get_hires(self):
-        hired_ids = self.actual_q_ids - self.last_q_ids
-        hires = self.actual_q_df[self.actual_q_df[self.employee_id_col].isin(hired_ids)]
-        hires["reason"] = "Hire"
-        return hires
+        :param department: The department looked at
+        :return: A `(total, female)` tuple.
+        """
+        return self._flow(
+            (self.table[FROM_COLUMN] == department)
+            & (self.table[TO_COLUMN] != department)
+        )
 
-    def get_lateral_movements_in(self):
-        lateral_in_df = self.actual_q_df[
-            (self.actual_q_df[self.department_col] == self.department)
-            & (self.actual_q_df[self.employee_id_col].isin(self.last_q_ids))
-        ]
-        last_q_lateral_in_df = self.last_q_df[
-            self.last_q_df[self.employee_id_col].isin(
-                lateral_in_df[self.employee_id_col]
+    def population(self, department, snapshot="last"):
+        """
+        The function `population` counts the employees of a department in one of the two snapshots.
+
+        :param department: The department looked at
+        :param snapshot: "last" or "actual", defaults to "last"
+        :return: A `(total, female)` tuple.
+        """
+        if department not in self.populations.index:
+            return 0, 0
+        counts = self.populations.loc[department, snapshot]
+        return int(counts["total"]), int(counts["female"])
+
+    def _unit_flows(self, rows, dim):
+        # employees whose `dim` changed, counted out of their previous unit and into the new one
+        in_last = rows["_pos_last"].notna()
+        came_from = rows[dim + "_last"].astype(object).where(in_last, HIRE)
+        went_to = (
+            rows[dim + "_current"]
+            .astype(object)
+            .where(rows["_pos_current"].notna(), TERMINATION)
+        )
+        female = (
+            rows["gender_last"].astype(object).where(in_last, rows["gender_current"])
+            == "Female"
+        )
+        moved = (came_from != went_to).to_numpy()
+        counts = {}
+        for name, units in (("out", came_from), ("in", went_to)):
+            counts[name] = (
+                female[moved]
+                .groupby(units[moved].to_numpy())
+                .agg(["size", "sum"])
+                .set_axis(["total", "female"], axis=1)
             )
-        ]
+        return pd.concat(counts, axis=1)
+
+    def _offenders(self, dim):
+        # employees whose rows can not be counted once: duplicated in a snapshot, or paired with
+        # rows classified differently
+        joined = self.joined
+        ids = joined[self.employee_id_col]
+        grade_last = joined[pay_grades.ORDINAL_COLUMN + "_last"]
+        grade_current = joined[pay_grades.ORDINAL_COLUMN + "_current"]
+        kind = np.select(
+            [
+                joined["_pos_current"].isna().to_numpy(),
+                joined["_pos_last"].isna().to_numpy(),
+                (
+                    joined[dim + "_last"].astype(object)
+                    != joined[dim + "_current"].astype(object)
+                ).to_numpy(),
+                (grade_last < grade_current).to_numpy(),
+                (grade_last > grade_current).to_numpy(),
+            ],
+            [TERMINATION, HIRE, "Lateral", PROMOTION, DEMOTION],
+            default=NO_MOVEMENT,
+        )
+        gender_changed = (
+            joined["gender_last"].notna()
+            & joined["gender_current"].notna()
+            & (
+                joined["gender_last"].astype(object)
+                != joined["gender_current"].astype(object)
+            )
+        )
+        per_employee = pd.DataFrame(
+            {
+                "last_rows": joined["_pos_last"],
+                "current_rows": joined["_pos_current"],
+                "kind": kind,
+                "gender_changed": gender_changed,
+            }
+        ).groupby(ids.to_numpy())
+        counts = per_employee.agg(
+            {
+                "last_rows": "nunique",
+                "current_rows": "nunique",
+                "kind": "nunique",
+                "gender_changed": "any",
+            }
+        )
+        issues = pd.DataFrame(
+            {
+                DUPLICATED_LAST: counts["last_rows"] > 1,
+                DUPLICATED_ACTUAL: counts["current_rows"] > 1,
+                SEVERAL_MOVEMENTS: counts["kind"] > 1,
+                CHANGED_GENDER: counts["gender_changed"],
+            }
+        )
+        flagged = issues.loc[issues.any(axis=1)]
+        if flagged.empty:
+            return pd.DataFrame(columns=["Employee IDs", "Issues"])
 
-        merged_df = self._merge_dataframes(
-            last_q_lateral_in_df,
-            lateral_in_df,
-            on_cols=[self.employee_id_col],
-            how="inner",
+        units = pd.concat(
+            [
+                pd.DataFrame({"unit": joined[dim + side], "employee": ids})
+                for side in ("_last", "_current")
+            ],
+            ignore_index=True,
         )
-        merged_df = merged_df[
-            merged_df[self.department_col + "_last"] != self.department
-        ]
-        merged_df["reason"] = (
-            "Lateral Movement In from " + merged_df[self.department_col + "_last"]
+        units = units.loc[units["employee"].isin(flagged.index)].dropna()
+        units["unit"] = units["unit"].astype(object)
+        units = units.drop_duplicates().sort_values(["unit", "employee"])
+        labels = flagged.apply(
+            lambda row: [issue for issue, found in row.items() if found], axis=1
+        )
+        units["issues"] = units["employee"].map(labels)
+        return units.groupby("unit").agg(
+            **{
+                "Employee IDs": ("employee", list),
+                "Issues": (
+                    "issues",
+                    lambda values: sorted({issue for row in values for issue in row}),
+                ),
+            }
         )
 
-        return merged_df.drop_duplicates(self.employee_id_col)
+    def reconcile(self, dimensions=RECONCILE_DIMENSIONS) -> pd.DataFrame:
+        """
+        The function `reconcile` checks that `last - outflow + inflow == actual` holds for the total and
+        the female population of every department and market at once.
+
+        :param dimensions: The columns whose units are reconciled, defaults to department and market
+        :return: A DataFrame with one row per unit and measure that does not reconcile, with the employee
+        ids that explain the difference (see `RECONCILE_COLUMNS`); empty when everything reconciles.
+        """
+        if dimensions == RECONCILE_DIMENSIONS and self._reconciliation is not None:
+            return self._reconciliation
+
+        rows = self._counted_rows()
+        tables = []
+        for dim in dimensions:
+            if dim not in self.unit_populations:
+                continue
+            flows = self._unit_flows(rows, dim)
+            units = self.unit_populations[dim].join(flows, how="outer").fillna(0)
+            units = units.loc[~units.index.isin([HIRE, TERMINATION])]
+            # the offenders of a dimension serve both measures, they are grouped at most once
+            offenders = None
+            for measure, column in (("Total", "total"), ("Female", "female")):
+                expected = (
+                    units[("last", column)]
+                    - units[("out", column)]
+                    + units[("in", column)]
+                )
+                table = pd.DataFrame(
+                    {
+                        "Dimension": dim,
+                        "Unit": units.index.astype(object),
+                        "Measure": measure,
+                        "Last_q population": units[("last", column)],
+                        "Outflow": units[("out", column)],
+                        "Inflow": units[("in", column)],
+                        "Expected": expected,
+                        "Actual_q population": units[("actual", column)],
+                        "Difference": units[("actual", column)] - expected,
+                    }
+                )
+                table = table.loc[table["Difference"] != 0]
+                if not table.empty:
+                    if offenders is None:
+                        offenders = self._offenders(dim)
+                    unit_offenders = offenders.reindex(table["Unit"])
+                    table["Employee IDs"] = unit_offenders["Employee IDs"].to_numpy()
+                    table["Issues"] = unit_offenders["Issues"].to_numpy()
+                    tables.append(table)
+
+        reconciliation = (
+            pd.concat(tables, ignore_index=True)
+            if tables
+            else pd.DataFrame(columns=RECONCILE_COLUMNS)
+        )
+        count_columns = RECONCILE_COLUMNS[3:9]
+        reconciliation[count_columns] = reconciliation[count_columns].astype(int)
+        reconciliation = reconciliation.sort_values(
+            ["Dimension", "Unit", "Measure"], ignore_index=True
+        )[RECONCILE_COLUMNS]
+        if dimensions == RECONCILE_DIMENSIONS:
+            self._reconciliation = reconciliation
+        return reconciliation
 
-    def get_lateral_movements_out(self):
-        lateral_out_df = self.last_q_df[
-            (self.last_q_df[self.department_col] == self.department)
-            & (self.last_q_df[self.employee_id_col].isin(self.actual_q_ids))
-        ]
-        actual_q_lateral_out_df = self.actual_q_df[
-            self.actual_q_df[self.employee_id_col].isin(
-                lateral_out_df[self.employee_id_col]
-            )
-        ]
 
-        merged_df = self._merge_dataframes(
-            lateral_out_df,
-            actual_q_lateral_out_df,
-            on_cols=[self.employee_id_col],
-            how="inner",
+class EmployeeMovements:
+    def __init__(
+        self,
+        last_q_df,
+        actual_q_df,
+        department,
+        department_col="department",
+        employee_id_col="employee_id",
+        matrix=None,
+    ):
+        self.department = department
+        self.department_col = department_col
+        self.employee_id_col = employee_id_col
+
+        # the organisation wide matrix is shared by every department of the same snapshot pair
+        self.matrix = matrix or MovementMatrix.for_pair(
+            last_q_df, actual_q_df, department_col, employee_id_col
         )
-        merged_df = merged_df[
-            merged_df[self.department_col + "_current"] != self.department
-        ]
-        merged_df["reason"] = (
-            "Lateral Movement Out to " + merged_df[self.department_col + "_current"]
+        self.joined = self.matrix.rows_of(department)
+        self.movements = self._classify(self.joined)
+
+    def _columns(self):
+        return _columns(self.department_col, self.employee_id_col)
+
+    def _classify(self, joined):
+        in_last = joined["_pos_last"].notna().to_numpy()
+        in_current = joined["_pos_current"].notna().to_numpy()
+        in_both = in_last & in_current
+        was_here = (joined[self.department_col + "_last"] == self.department).to_numpy()
+        is_here = (
+            joined[self.department_col + "_current"] == self.department
+        ).to_numpy()
+
+        grade_last = joined[pay_grades.ORDINAL_COLUMN + "_last"].to_numpy()
+        grade_current = joined[pay_grades.ORDINAL_COLUMN + "_current"].to_numpy()
+        promoted = in_both & (grade_last < grade_current)
+        demoted = in_both & (grade_last > grade_current)
+
+        moved_in = in_both & is_here & ~was_here
+        moved_out = in_both & was_here & ~is_here
+        stayed = in_both & was_here & is_here
+
+        movement = np.select(
+            [
+                in_last & ~in_current & was_here,
+                in_current & ~in_last & is_here,
+                moved_in & promoted,
+                moved_in & demoted,
+                moved_in,
+                moved_out & promoted,
+                moved_out & demoted,
+                moved_out,
+                stayed & promoted,
+                stayed & demoted,
+            ],
+            [
+                TERMINATION,
+                HIRE,
+                LATERAL_IN_PROMOTION,
+                LATERAL_IN_DEMOTION,
+                LATERAL_IN,
+                LATERAL_OUT_PROMOTION,
+                LATERAL_OUT_DEMOTION,
+                LATERAL_OUT,
+                PROMOTION,
+                DEMOTION,
+            ],
+            default=NO_MOVEMENT,
         )
+        return pd.Categorical(movement, categories=MOVEMENT_CLASSES, ordered=True)
+
+    def _describe(self, mask):
+        # one row per movement, described from the side of the department the employee is in
+        joined = self.joined.loc[mask]
+        movement = pd.Series(self.movements[mask], index=joined.index, name="movement")
+        leaving = movement.isin(LEAVING_CLASSES)
+
+        described = pd.DataFrame({self.employee_id_col: joined[self.employee_id_col]})
+        for col in self._columns()[1:]:
+            described[col] = joined[col + "_current"].where(
+                ~leaving, joined[col + "_last"]
+            )
 
-        return merged_df.drop_duplicates(self.employee_id_col)
-
-    def get_promotions(self):
-        merged_df = self._merge_dataframes(
-            self.last_q_df,
-            self.actual_q_df,
-            on_cols=[self.employee_id_col],
-            how="inner",
-        )
-        promotions = merged_df[
-            merged_df["pay_grade_last"] < merged_df["pay_grade_current"]
-        ]
-        promotions["reason"] = "Promotion"
-
-        return promotions
+        reason = movement.astype(str)
+        lateral_in = movement.isin(
+            [LATERAL_IN, LATERAL_IN_PROMOTION, LATERAL_IN_DEMOTION]
+        )
+        lateral_out = movement.isin(
+            [LATERAL_OUT, LATERAL_OUT_PROMOTION, LATERAL_OUT_DEMOTION]
+        )
+        reason[lateral_in] += " from " + joined.loc[
+            lateral_in, self.department_col + "_last"
+        ].astype(str)
+        reason[lateral_out] += " to " + joined.loc[
+            lateral_out, self.department_col + "_current"
+        ].astype(str)
+        described["reason"] = reason
+        described["movement"] = movement
+
+        # report order: by class, then in the order of the snapshots
+        order = np.lexsort(
+            (
+                joined["_pos_current"].fillna(-1).to_numpy(),
+                joined["_pos_last"].fillna(-1).to_numpy(),
+                movement.cat.codes.to_numpy(),
+            )
+        )
+        return described.iloc[order].reset_index(drop=True)
 
-    def get_demotions(self):
-        merged_df = self._merge_dataframes(
-            self.last_q_df,
-            self.actual_q_df,
-            on_cols=[self.employee_id_col],
-            how="inner",
-        )
-        demotions = merged_df[
-            merged_df["pay_grade_last"] > merged_df["pay_grade_current"]
-        ]
-        demotions["reason"] = "Demotion"
+    def _of_class(self, classes):
+        return self._describe(np.isin(np.asarray(self.movements), classes))
 
-        return demotions
+    def get_terminations(self):
+        return self._of_class([TERMINATION])
 
-    def get_lateral_with_promotion_or_demotion(self):
-        lateral_in = self.get_lateral_movements_in()
-        lateral_out = self.get_lateral_movements_out()
+    def get_hires(self):
+        return self._of_class([HIRE])
 
-        lateral_with_promotion = lateral_in[
-            lateral_in["pay_grade_last"] < lateral_in["pay_grade_current"]
-        ]
-        lateral_with_promotion["reason"] = (
-            "Lateral In with Promotion from "
-            + lateral_with_promotion[self.department_col + "_last"]
-        )
+    def get_lateral_movements_in(self):
+        return self._of_class([LATERAL_IN, LATERAL_IN_PROMOTION, LATERAL_IN_DEMOTION])
 
-        lateral_with_demotion = lateral_in[
-            lateral_in["pay_grade_last"] > lateral_in["pay_grade_current"]
-        ]
-        lateral_with_demotion["reason"] = (
-            "Lateral In with Demotion from "
-            + lateral_with_demotion[self.department_col + "_last"]
+    def get_lateral_movements_out(self):
+        return self._of_class(
+            [LATERAL_OUT, LATERAL_OUT_PROMOTION, LATERAL_OUT_DEMOTION]
         )
 
-        # Lateral Out with Promotion or Demotion
-        lateral_out_with_promotion = lateral_out[
-            lateral_out["pay_grade_last"] < lateral_out["pay_grade_current"]
-        ]
-        lateral_out_with_promotion["reason"] = (
-            "Lateral Out with Promotion to "
-            + lateral_out_with_promotion[self.department_col + "_current"]
-        )
+    def get_promotions(self):
+        return self._of_class([PROMOTION])
 
-        lateral_out_with_demotion = lateral_out[
-            lateral_out["pay_grade_last"] > lateral_out["pay_grade_current"]
-        ]
-        lateral_out_with_demotion["reason"] = (
-            "Lateral Out with Demotion to "
-            + lateral_out_with_demotion[self.department_col + "_current"]
-        )
+    def get_demotions(self):
+        return self._of_class([DEMOTION])
 
-        return pd.concat(
+    def get_lateral_with_promotion_or_demotion(self):
+        return self._of_class(
             [
-                lateral_with_promotion,
-                lateral_with_demotion,
-                lateral_out_with_promotion,
-                lateral_out_with_demotion,
-            ],
-            ignore_index=True,
+                LATERAL_IN_PROMOTION,
+                LATERAL_IN_DEMOTION,
+                LATERAL_OUT_PROMOTION,
+                LATERAL_OUT_DEMOTION,
+            ]
         )
 
     def get_all_movements(self):
-        terminations = self.get_terminations()
-        hires = self.get_hires()
-        lateral_in = self.get_lateral_movements_in()
-        lateral_out = self.get_lateral_movements_out()
-        promotions = self.get_promotions()
-        demotions = self.get_demotions()
-        lateral_with_promotion_or_demotion = (
-            self.get_lateral_with_promotion_or_demotion()
-        )
-
-        all_movements = pd.concat(
-            [
-                terminations,
-                hires,
-                lateral_in,
-                lateral_out,
-                promotions,
-                demotions,
-                lateral_with_promotion_or_demotion,
-            ],
-            ignore_index=True,
-        )
+        all_movements = self._of_class(MOVEMENT_CLASSES[:-1])
 
         # Adjust the required_columns list to correctly reference the merged columns
         required_columns = [
@@ -216,37 +623,18 @@ class EmployeeMovements:
         )
 
     def calculate_inflow(self):
-        hires = self.get_hires()
-        lateral_in = self.get_lateral_movements_in()
-        lateral_with_promotion_or_demotion = (
-            self.get_lateral_with_promotion_or_demotion()
-        )
-
-        inflow_population_df = pd.concat(
-            [hires, lateral_in, lateral_with_promotion_or_demotion], ignore_index=True
-        )
-        inflow_total, inflow_female = self._calculate_population(inflow_population_df)
-
-        return inflow_total, inflow_female
+        return self.matrix.inflow(self.department)
 
     def calculate_outflow(self):
-        terminations = self.get_terminations()
-        lateral_out = self.get_lateral_movements_out()
-        outflow_population_df = pd.concat(
-            [terminations, lateral_out], ignore_index=True
-        )
-
-        outflow_total, outflow_female = self._calculate_population(
-            outflow_population_df
-        )
-
-        return outflow_total, outflow_female
+        return self.matrix.outflow(self.department)
 
     def get_population_summary(self):
-        last_q_total, last_q_female = self._calculate_population(self.last_q_df)
+        last_q_total, last_q_female = self.matrix.population(self.department, "last")
         inflow_total, inflow_female = self.calculate_inflow()
         outflow_total, outflow_female = self.calculate_outflow()
-        actual_q_total, actual_q_female = self._calculate_population(self.actual_q_df)
+        actual_q_total, actual_q_female = self.matrix.population(
+            self.department, "actual"
+        )
 
         # Validate the population calculations to ensure the rule is respected
         calculated_actual_q_total = last_q_total - outflow_total + inflow_total
@@ -265,6 +653,17 @@ class EmployeeMovements:
                     f"Expected female: {calculated_actual_q_female}, Actual female: {actual_q_female}",
                 )
             )
+            mismatches = self.matrix.reconcile()
+            offenders = mismatches.loc[
+                (mismatches["Dimension"] == self.department_col)
+                & (mismatches["Unit"] == self.department),
+                "Employee IDs",
+            ]
+            if not offenders.empty and isinstance(offenders.iloc[0], list):
+                warnings.append(
+                    "Employees to check: "
+                    + ", ".join(str(emp) for emp in offenders.iloc[0])
+                )
         summary_data = {
             " ": ["Total Population", "Female #"],
             "Last_q population": [last_q_total, last_q_female],
@@ -280,3 +679,233 @@ class EmployeeMovements:
             return summary_df, warnings_df
 
         return summary_df, None
+
+
+_timelines = {}
+_timelines_lock = threading.Lock()
+
+
+class MovementTimeline:
+    def __init__(
+        self,
+        df,
+        snap_column="snapshot_date",
+        department_col="department",
+        employee_id_col="employee_id",
+    ):
+        self.department_col = department_col
+        snapshots = df[snap_column]
+        if not isinstance(snapshots.dtype, pd.CategoricalDtype):
+            snapshots = pd.Series(
+                pd.Categorical(
+                    snapshots, categories=schema.sort_snapshots(snapshots.dropna())
+                ),
+                index=df.index,
+            )
+        codes = snapshots.cat.codes.to_numpy()
+        present = np.bincount(
+            codes[codes >= 0], minlength=len(snapshots.cat.categories)
+        )
+        self.snapshots = list(snapshots.cat.categories[present > 0])
+        self.pairs = list(zip(self.snapshots[:-1], self.snapshots[1:]))
+
+        # rows sorted by snapshot then employee: every snapshot is a block of sorted ids, and the
+        # same employee one snapshot later is found by a binary search on `snapshot * width + id`
+        snap_codes = pd.Categorical(snapshots, categories=self.snapshots).codes.astype(
+            np.int64
+        )
+        id_codes = pd.factorize(df[employee_id_col])[0].astype(np.int64)
+        keep = np.flatnonzero((snap_codes >= 0) & (id_codes >= 0))
+        order = keep[np.lexsort((id_codes[keep], snap_codes[keep]))]
+        self._width = int(id_codes.max()) + 1 if len(id_codes) else 1
+        self._snap = snap_codes[order]
+        self._keys = self._snap * self._width + id_codes[order]
+
+        frame = pay_grades.with_ordinals(df.iloc[order])
+        self._department = frame[department_col].astype(object).to_numpy()
+        self._gender = frame["gender"].astype(object).to_numpy()
+        self._band = (
+            pay_grades.band_of(frame[pay_grades.ORDINAL_COLUMN])
+            .astype(object)
+            .to_numpy()
+        )
+
+        self.table = self._transitions()
+        self.populations = self._populations()
+
+    @classmethod
+    def for_frame(cls, df):
+        """
+        The function `for_frame` returns the timeline of a DataFrame, building it only the first time it
+        is asked for. The timeline is dropped together with the DataFrame.
+
+        :param df: A raw data like DataFrame holding every snapshot
+        :return: The `MovementTimeline` of `df`.
+        """
+        key = id(df)
+        with _timelines_lock:
+            entry = _timelines.get(key)
+            if entry is not None and entry[0]() is df:
+                return entry[1]
+
+        timeline = cls(df)
+        with _timelines_lock:
+            _timelines[key] = (
+                weakref.ref(df, lambda _, key=key: _timelines.pop(key, None)),
+                timeline,
+            )
+        return timeline
+
+    def _first_match(self, rows, offset):
+        # first row of the same employee `offset` keys away, and whether there is one
+        targets = self._keys[rows] + offset
+        found = np.searchsorted(self._keys, targets, side="left")
+        found = np.minimum(found, len(self._keys) - 1)
+        return found, self._keys[found] == targets
+
+    def _transitions(self):
+        positions = np.arange(len(self._keys))
+
+        # every row of a snapshot is counted once, with its first match in the next snapshot
+        leaving = positions[self._snap < len(self.snapshots) - 1]
+        matched, stays = self._first_match(leaving, self._width)
+
+        # rows of a snapshot without a match in the previous one are hires
+        arriving = positions[self._snap > 0]
+        _, returning = self._first_match(arriving, -self._width)
+        hired = arriving[~returning]
+
+        no_band = np.full(len(hired), None, dtype=object)
+        transitions = pd.DataFrame(
+            {
+                "pair": np.concatenate([self._snap[leaving], self._snap[hired] - 1]),
+                FROM_COLUMN: np.concatenate(
+                    [self._department[leaving], np.full(len(hired), HIRE, dtype=object)]
+                ),
+                TO_COLUMN: np.concatenate(
+                    [
+                        np.where(stays, self._department[matched], TERMINATION),
+                        self._department[hired],
+                    ]
+                ),
+                "gender": np.concatenate([self._gender[leaving], self._gender[hired]]),
+                "from_band": np.concatenate([self._band[leaving], no_band]),
+                "to_band": np.concatenate(
+                    [np.where(stays, self._band[matched], None), self._band[hired]]
+                ),
+            }
+        )
+
+        table = (
+            transitions.groupby(list(transitions.columns), dropna=False)
+            .size()
+            .rename("headcount")
+            .reset_index()
+        )
+        pair_codes = table.pop("pair").to_numpy()
+        snapshots = np.asarray(self.snapshots, dtype=object)
+        table.insert(0, "last_snapshot", snapshots[pair_codes])
+        table.insert(1, "actual_snapshot", snapshots[pair_codes + 1])
+        return table
+
+    def _populations(self):
+        frame = pd.DataFrame(
+            {
+                "snapshot": np.asarray(self.snapshots, dtype=object)[self._snap],
+                self.department_col: self._department,
+                "female": self._gender == "Female",
+            }
+        )
+        return (
+            frame.groupby(["snapshot", self.department_col], sort=False)["female"]
+            .agg(["size", "sum"])
+            .set_axis(["total", "female"], axis=1)
+        )
+
+    def pair(self, last_snapshot, actual_snapshot) -> pd.DataFrame:
+        """
+        The function `pair` returns the movement matrix of two consecutive snapshots.
+
+        :param last_snapshot: The previous snapshot_date
+        :param actual_snapshot: The actual snapshot_date
+        :return: The rows of `table` of the pair.
+        """
+        return self.table.loc[
+            (self.table["last_snapshot"] == last_snapshot)
+            & (self.table["actual_snapshot"] == actual_snapshot)
+        ]
+
+    def flows(self, department=None) -> pd.DataFrame:
+        """
+        The function `flows` lists the population, hires, terminations and lateral moves of every
+        consecutive snapshot pair, for the organisation or for one department.
+
+        :param department: The department looked at; the whole organisation when `None`, defaults to None
+        :return: A DataFrame indexed by (last_snapshot, actual_snapshot), in chronological order.
+        """
+        table = self.table
+        came_from, went_to = table[FROM_COLUMN], table[TO_COLUMN]
+        hired = came_from == HIRE
+        terminated = went_to == TERMINATION
+        if department is None:
+            masks = {
+                "Hires": hired,
+                "Terminations": terminated,
+                "Lateral In": pd.Series(False, index=table.index),
+                "Lateral Out": pd.Series(False, index=table.index),
+            }
+            populations = self.populations.groupby(level="snapshot", sort=False).sum()
+        else:
+            masks = {
+                "Hires": hired & (went_to == department),
+                "Terminations": terminated & (came_from == department),
+                "Lateral In": ~hired
+                & (went_to == department)
+                & (came_from != department),
+                "Lateral Out": ~terminated
+                & (came_from == department)
+                & (went_to != department),
+            }
+            populations = self.populations.xs(
+                department, level=self.department_col
+            ).reindex(self.snapshots, fill_value=0)
+
+        index = pd.MultiIndex.from_tuples(
+            self.pairs, names=["last_snapshot", "actual_snapshot"]
+        )
+        keys = [table["last_snapshot"], table["actual_snapshot"]]
+        flows = pd.DataFrame(
+            {
+                name: table["headcount"]
+                .where(mask, 0)
+                .groupby(keys, sort=False)
+                .sum()
+                .reindex(index, fill_value=0)
+                for name, mask in masks.items()
+            },
+            index=index,
+        )
+        flows["Inflow"] = flows["Hires"] + flows["Lateral In"]
+        flows["Outflow"] = flows["Terminations"] + flows["Lateral Out"]
+        totals = populations["total"].reindex(self.snapshots, fill_value=0).to_numpy()
+        flows.insert(0, "Last_q population", totals[:-1])
+        flows["Actual_q population"] = totals[1:]
+        return flows
+
+    def attrition(self, department=None, window=4) -> pd.Series:
+        """
+        The function `attrition` calculates the rolling attrition rate: the terminations of the last
+        `window` snapshot pairs over the average population at their start.
+
+        :param department: The department looked at; the whole organisation when `None`, defaults to None
+        :param window: The number of snapshot pairs in the rolling window, defaults to 4
+        :return: A Series of percentages indexed like `flows`.
+        """
+        flows = self.flows(department)
+        terminations = flows["Terminations"].rolling(window, min_periods=1).sum()
+        population = flows["Last_q population"].rolling(window, min_periods=1).mean()
+        return pd.Series(
+            calculus.get_percentages(population, terminations),
+            index=flows.index,
+            name="Attrition %",
+        )
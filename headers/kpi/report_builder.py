@@ -1,26 +1,113 @@
 import traceback
-from . import kpi_department as kdep
-from . import kpi_market as kmkt
 from . import movements as mv
+from . import kpi_cube
 import pandas as pd
 import os
 from . import calculus
 from .. import file_ops as fo
-import xlwings as xw
-import threading
-from .. import consolidate as CS
-from . import excel_styles as es
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from . import writers
+from .. import pay_grades
+from .. import dataset_cache
+from . import report_context
+from . import report_manifest
+
+# number of processes building reports in parallel, None for one per core
+REPORT_WORKERS = None
+
+# part of the hash of every report, to be increased whenever the content or the look of the reports
+# changes so that "Generate all" builds them again
+REPORT_LAYOUT_VERSION = 1
+
+RESULT_COLUMNS = ["department", "status", "path", "error", "seconds"]
+
+# the `ReportContext` the report workers receive once, when they start
+_worker_context = None
+
+
+def _init_worker(context):
+    global _worker_context
+    _worker_context = context
+
+
+def _build_in_worker(dpt, backend):
+    return BuildReport.from_context(dpt, _worker_context).build_report_result(backend)
 
 
 class BuildReport(fo.FilePrep):
-    def __init__(self, dpt: str) -> None:
+    def __init__(self, dpt: str, context: report_context.ReportContext = None) -> None:
         super().__init__()
+        self.use_context(dpt, context or report_context.ReportContext.shared(self))
+
+    @classmethod
+    def from_context(cls, dpt: str, context: report_context.ReportContext):
+        """
+        The function `from_context` creates the report of a department from a precomputed context,
+        without reading the raw data again. The report is initialised like any `FilePrep`, then pointed to
+        the raw data of the context.
+
+        :param dpt: The department of the report
+        :type dpt: str
+        :param context: The context shared by the reports
+        :type context: ReportContext
+        :return: A `BuildReport` ready to be built.
+        """
+        report = cls.__new__(cls)
+        fo.FilePrep.__init__(report)
+        report.file_name = context.file_name
+        report.store = context.store
+        report.use_context(dpt, context)
+        return report
+
+    def use_context(self, dpt: str, context: report_context.ReportContext) -> None:
+        """
+        The function `use_context` points the report to the department and to the shared data it is
+        built from.
+        """
         self.dpt = dpt
-        self.dpt_list = CS.GatherData().form_combo("department")
-        self.last_q = self.map_q()[0]
-        self.actual_q = self.map_q()[1]
-        self.last_df = self.split_by_snap()[0]
-        self.actual_df = self.split_by_snap()[1]
+        self.context = context
+        self.dpt_list = context.dpt_list
+        self.last_q = context.last_q
+        self.actual_q = context.actual_q
+        self.last_df = context.last_df
+        self.actual_df = context.actual_df
+
+    def movement_matrix(self):
+        """
+        The function `movement_matrix` returns the organisation wide movement matrix of the last two
+        snapshots, computed once by the report context and shared by the reports of every department.
+        :return: The `MovementMatrix` of the previous and the actual snapshot.
+        """
+        return self.context.movement_matrix
+
+    def movement_timeline(self):
+        """
+        The function `movement_timeline` returns the movements of every consecutive snapshot pair of the
+        raw data, for trend charts and rolling attrition. It is computed once until the raw data changes.
+        :return: The `MovementTimeline` of the raw data.
+        """
+        return dataset_cache.get_or_load(
+            self.cache_key(),
+            lambda: mv.MovementTimeline(self.update_df()),
+            variant="movement_timeline",
+        )
+
+    def reconcile(self):
+        """
+        The function `reconcile` checks the populations of every department and market against the
+        movements of the last two snapshots, before any report is built.
+        :return: The mismatch table of `MovementMatrix.reconcile`, empty when everything reconciles.
+        """
+        mismatches = self.movement_matrix().reconcile()
+        for row in mismatches.to_dict("records"):
+            self.grab_logs.form_log(
+                f"Population mismatch for {row['Dimension']} {row['Unit']} ({row['Measure']}): "
+                f"expected {row['Expected']}, found {row['Actual_q population']}. "
+                f"Employees to check: {row['Employee IDs']}",
+                self.grab_logs.get_level("warn"),
+            )
+        return mismatches
 
     def _check_department_validity(self):
         if self.dpt not in self.dpt_list:
@@ -29,26 +116,25 @@ class BuildReport(fo.FilePrep):
     def get_um_df(self, df):
         """
         The function `get_um_df` filters a DataFrame based on specified pay grades and department.
-        
+
         :param df: The `get_um_df` method takes a DataFrame `df` as input. It filters the DataFrame based on
         the conditions specified in the code and returns a subset of the DataFrame that meets those
-        conditions. The conditions include filtering rows where the "pay_grade" is one of ["G37", "G
+        conditions. The conditions include filtering rows where the "pay_grade" belongs to the UM band
         :return: The `get_um_df` method is returning a subset of the input DataFrame `df` where the
-        pay_grade is in the list ["G37", "G38", "G39", "G40", "G41"] and the department matches the
+        pay_grade is in the UM band (G37 to G41 by default) and the department matches the
         department stored in the `self.dpt` attribute. The returned DataFrame contains columns "first_name",
         "last_name", "gender", and "
         """
         self._check_department_validity()
         return df.loc[
-            (df["pay_grade"].isin(["G37", "G38", "G39", "G40", "G41"]))
-            & (df["department"] == self.dpt),
+            pay_grades.band_mask(df, "UM") & (df["department"] == self.dpt),
             ["first_name", "last_name", "gender", "pay_grade"],
         ]
 
     def get_um_fem_df(self, df):
         self._check_department_validity()
         return df.loc[
-            (df["pay_grade"].isin(["G37", "G38", "G39", "G40", "G41"]))
+            pay_grades.band_mask(df, "UM")
             & (df["department"] == self.dpt)
             & (df["gender"] == "Female"),
             ["first_name", "last_name", "gender", "pay_grade"],
@@ -63,8 +149,7 @@ class BuildReport(fo.FilePrep):
     def get_lm_df(self, df):
         self._check_department_validity()
         return df.loc[
-            (df["pay_grade"].isin(["G34", "G35", "G36"]))
-            & (df["department"] == self.dpt),
+            pay_grades.band_mask(df, "LM") & (df["department"] == self.dpt),
             ["first_name", "last_name", "gender", "pay_grade"],
         ]
 
@@ -72,97 +157,238 @@ class BuildReport(fo.FilePrep):
         return self.get_lm_df(df).values.tolist()
 
     def get_gender_split_um(self, df):
-        analytics = kdep.EmployeeAnalytics(df, self.dpt)
-        total = analytics.get_total_employees_um()
-        fem = analytics.get_woman_um()
+        cube = kpi_cube.KpiCube.for_frame(df)
+        total = cube.headcount(department=self.dpt, band="UM")
+        fem = cube.headcount(department=self.dpt, band="UM", gender="Female")
         proc = calculus.get_percentage(total, fem)
 
         return [int(total), int(fem), float(proc)]
 
     def get_gender_split_lm(self, df):
-        analytics = kdep.EmployeeAnalytics(df, self.dpt)
-        total = analytics.get_total_employees_lm()
-        fem = analytics.get_woman_lm()
+        cube = kpi_cube.KpiCube.for_frame(df)
+        total = cube.headcount(department=self.dpt, band="LM")
+        fem = cube.headcount(department=self.dpt, band="LM", gender="Female")
         proc = calculus.get_percentage(total, fem)
 
         return [int(total), int(fem), float(proc)]
 
-    def build_report(self):
-        rep_title = f"{self.last_q[0]} {self.last_q[1]} vs {self.actual_q[0]} {self.actual_q[1]} {self.dpt}.xlsx"
-        rep_loc = os.path.join(os.getcwd(), "QvQ Files", rep_title)
+    def report_title(self) -> str:
+        """
+        The function `report_title` names the report of the department after the compared quarters.
+        :return: A title such as "Q2 2024 vs Q3 2024 Sales".
+        """
+        return f"{self.last_q[0]} {self.last_q[1]} vs {self.actual_q[0]} {self.actual_q[1]} {self.dpt}"
+
+    def report_location(self, backend: str = None) -> str:
+        """
+        The function `report_location` returns the path of the report of the department.
+        :param backend: The report writer, which decides the file extension, defaults to
+        `writers.default_backend()`
+        :return: The path of the report in the "QvQ Files" folder.
+        """
+        rep_title = self.report_title() + writers.extension_of(backend)
+        return os.path.join(os.getcwd(), "QvQ Files", rep_title)
+
+    def report_digest(self) -> str:
+        """
+        The function `report_digest` hashes the inputs of the report of the department.
+        :return: The digest of `ReportContext.department_digest` for the current layout version.
+        """
+        return self.context.department_digest(self.dpt, REPORT_LAYOUT_VERSION)
+
+    def report_manifest(self) -> report_manifest.ReportManifest:
+        """
+        The function `report_manifest` opens the manifest of the folder the reports are written to.
+        :return: The `ReportManifest` of the "QvQ Files" folder.
+        """
+        return report_manifest.ReportManifest(os.path.dirname(self.report_location()))
+
+    def build_report(self, backend: str = None):
+        """
+        The `build_report` function writes the report of the department to the "QvQ Files" folder.
 
-        with xw.App(visible=False) as rb:
-            wb = rb.books.add()
-            rb.display_alerts = False
+        :param backend: The report writer to use, "xlsxwriter", "xlwings" or "html", defaults to
+        `writers.default_backend()`
+        :type backend: str
+        """
+        result = self.build_report_result(backend)
+        if result["status"] == "done":
+            self.report_manifest().record(result["path"], self.report_digest())
+        if result["status"] == "failed":
+            print(
+                f"Failed to save the report called {os.path.basename(result['path'])} to {result['path']}: "
+                f"{result['error']}"
+            )
+        return result["status"] == "done"
 
-            try:
-                self._rb_tasks(wb, rep_loc)
-            except Exception as e:
-                print(f"Failed to save the report called {rep_title} to {rep_loc}: {e}")
-                traceback.print_exc()
-            finally:
-                rb.display_alerts = True
-                wb.close()
+    def build_report_result(self, backend: str = None) -> dict:
+        """
+        The function `build_report_result` builds the report of the department and describes the outcome.
 
-    def build_report_all(self):
+        :param backend: The report writer to use, defaults to `writers.default_backend()`
+        :type backend: str
+        :return: A dictionary with the department, the status ("done" or "failed"), the path of the
+        report, the error message if any and the time taken in seconds.
+        """
+        started = time.perf_counter()
+        result = {
+            "department": self.dpt,
+            "status": "done",
+            "path": self.report_location(backend),
+            "error": None,
+        }
+        try:
+            with writers.open_writer(backend) as writer:
+                self._rb_tasks(writer, result["path"])
+        except Exception as e:
+            traceback.print_exc()
+            result["status"] = "failed"
+            result["error"] = f"{type(e).__name__}: {e}"
+        result["seconds"] = round(time.perf_counter() - started, 3)
+        return result
+
+    def render_html(self) -> str:
         """
-        The `build_report_all` function iterates through a list of departments, prints a progress message
-        for each department, builds a report, and then prints a completion message for each department.
+        The function `render_html` renders the report of the department as an HTML page, without writing
+        any file, e.g. for a preview in the app or the body of a mail.
+        :return: The HTML of the report.
         """
-        for dpt in self.dpt_list:
-            print(f"\n {dpt} report in progress")
-            self.build_report()
-            print(f"{dpt} report done")
+        with writers.open_writer(writers.HTML) as writer:
+            self._populate(writer)
+            return writer.render(self.report_title())
 
-    def _rb_tasks(self, wb, rep_loc):
-        ws1 = wb.sheets.add(name="Gender Split per market")
-        ws4 = wb.sheets.add(name="Movements")
-        ws5 = wb.sheets.add(name="Active Population")
-        ws6 = wb.sheets.add(name="Comments")
+    def build_report_all(
+        self, max_workers: int = None, backend: str = None, force: bool = False
+    ):
+        """
+        The `build_report_all` function builds the report of every department in parallel, on a pool of
+        processes that receive the precomputed snapshots once, and prints a message for each department.
+        Departments whose inputs hash the same as in the manifest of the reports folder are skipped.
+        HTML reports are cheap to render, so they are all rendered in this process with the same compiled
+        template.
+
+        :param max_workers: The number of processes, defaults to `REPORT_WORKERS` (one per core); 1 builds
+        the reports one after the other in this process
+        :type max_workers: int
+        :param backend: The report writer to use, defaults to `writers.default_backend()`
+        :type backend: str
+        :param force: Build every report, even the unchanged ones, defaults to False
+        :type force: bool
+        :return: A DataFrame with one row per department, see `build_report_result`; skipped departments
+        have the status "unchanged".
+        """
+        mismatches = self.reconcile()
+        if not mismatches.empty:
+            print(f"{len(mismatches)} population mismatches found, see the logs")
+
+        max_workers = max_workers or REPORT_WORKERS or os.cpu_count() or 1
+        context = self.context
+        manifest = self.report_manifest()
+        results = []
+
+        digests = {}
+        stale = []
+        for dpt in context.dpt_list:
+            report = self.from_context(dpt, context)
+            digests[dpt] = report.report_digest()
+            if not force and manifest.is_current(
+                report.report_location(backend), digests[dpt]
+            ):
+                results.append(
+                    {
+                        "department": dpt,
+                        "status": "unchanged",
+                        "path": report.report_location(backend),
+                        "error": None,
+                        "seconds": 0.0,
+                    }
+                )
+            else:
+                stale.append(dpt)
+        if results:
+            print(f"{len(results)} reports unchanged since the last run")
+
+        def collect(result):
+            results.append(result)
+            if result["status"] == "done":
+                manifest.record(result["path"], digests[result["department"]])
+                print(f"{result['department']} report done")
+            else:
+                print(f"{result['department']} report failed: {result['error']}")
+                self.grab_logs.form_log(
+                    f"{result['department']} report failed: {result['error']}",
+                    self.grab_logs.get_level("error"),
+                )
+
+        if max_workers == 1 or len(stale) < 2 or backend == writers.HTML:
+            for dpt in stale:
+                print(f"\n {dpt} report in progress")
+                collect(self.from_context(dpt, context).build_report_result(backend))
+        else:
+            with ProcessPoolExecutor(
+                max_workers=min(max_workers, len(stale)),
+                initializer=_init_worker,
+                initargs=(context,),
+            ) as pool:
+                futures = {
+                    pool.submit(_build_in_worker, dpt, backend): dpt for dpt in stale
+                }
+                for future in as_completed(futures):
+                    try:
+                        collect(future.result())
+                    except Exception as e:
+                        collect(
+                            {
+                                "department": futures[future],
+                                "status": "failed",
+                                "path": None,
+                                "error": f"{type(e).__name__}: {e}",
+                                "seconds": None,
+                            }
+                        )
+
+        order = {dpt: pos for pos, dpt in enumerate(context.dpt_list)}
+        results.sort(key=lambda result: order[result["department"]])
+        return pd.DataFrame(results, columns=RESULT_COLUMNS)
+
+    def _rb_tasks(self, writer, rep_loc):
+        self._populate(writer)
+        writer.save(rep_loc)
+
+    def _populate(self, writer):
+        ws1 = writer.add_sheet("Gender Split per market")
+        ws4 = writer.add_sheet("Movements")
+        ws5 = writer.add_sheet("Active Population")
+        ws6 = writer.add_sheet("Comments")
 
         self.populate_gender_split(ws1)
         self.populate_movements(ws4)
         self.populate_population_summary(ws5)
         self.populate_comments(ws6)
 
-        for sheet in wb.sheets:
-            sheet.autofit()
-            sheet.range("A1").expand().api.HorizontalAlignment = (
-                xw.constants.HAlign.xlHAlignCenter
-            )
-
-        if "Sheet1" in [sheet.name for sheet in wb.sheets]:
-            wb.sheets["Sheet1"].delete()
-
-        ws1.activate()
-        wb.save(rep_loc)
-
     def populate_gender_split(self, ws, *args):
         # sourcery skip: class-extract-method
-        ws["B2"].value = "Market Lists with gender %"
-        ws.range("B2:D2").merge()
-        es.header_text_look(ws, "A2:E2")
+        ws.write("B2", "Market Lists with gender %")
+        ws.merge("B2:D2")
+        ws.style("A2:E2", "header")
 
-        um_gen_df = kdep.EmployeeAnalytics(
-            self.actual_df, self.dpt
-        ).get_market_UM_by_dpt()
-        um_members = kdep.EmployeeAnalytics(
-            self.actual_df, self.dpt
-        ).get_um_members_w_data()
+        analytics = self.context.department_analytics(self.dpt)
+        um_gen_df = analytics.get_market_UM_by_dpt()
+        um_members = analytics.get_um_members_w_data()
 
         if um_gen_df is None:
-            es.write_dataframe_with_borders(ws, "B4", calculus.std_mt_df())
+            ws.write_table("B4", calculus.std_mt_df())
         else:
-            es.write_dataframe_with_borders(ws, "B4", um_gen_df)
+            ws.write_table("B4", um_gen_df)
 
-        ws["B17"].value = "Upper Management members"
-        ws.range("B17:D17").merge()
-        es.header2_text_look(ws, "A17:E17")
+        ws.write("B17", "Upper Management members")
+        ws.merge("B17:D17")
+        ws.style("A17:E17", "header2")
 
         if um_members is None:
-            es.write_dataframe_with_borders(ws, "B19", calculus.std_mt_df())
+            ws.write_table("B19", calculus.std_mt_df())
         else:
-            es.write_dataframe_with_borders(ws, "B19", um_members)
+            ws.write_table("B19", um_members)
 
         last_um_split = self.get_gender_split_um(self.last_df)
         actual_um_split = self.get_gender_split_um(self.actual_df)
@@ -194,7 +420,7 @@ class BuildReport(fo.FilePrep):
             }
         )
 
-        es.write_dataframe_with_borders(ws, "F4", um_qvq_df)
+        ws.write_table("F4", um_qvq_df)
 
         lm_qvq_df = pd.DataFrame(
             {
@@ -221,38 +447,35 @@ class BuildReport(fo.FilePrep):
             }
         )
 
-        es.write_dataframe_with_borders(ws, "F9", lm_qvq_df)
+        ws.write_table("F9", lm_qvq_df)
 
     def populate_movements(self, ws, *args):
-        ws["B2"].value = "Movement List"
-        ws.range("B2:D2").merge()
-        es.header_text_look(ws, "A2:E2")
+        ws.write("B2", "Movement List")
+        ws.merge("B2:D2")
+        ws.style("A2:E2", "header")
 
-        q_move = mv.EmployeeMovements(
-            self.last_df, self.actual_df, self.dpt
-        ).get_all_movements()
-        es.write_dataframe_with_borders(ws, "B4", q_move)
+        q_movements = self.context.department_movements(self.dpt)
+        q_move = q_movements.get_all_movements()
+        ws.write_table("B4", q_move)
 
-        summary_df, warnings_df = mv.EmployeeMovements(
-            self.last_df, self.actual_df, self.dpt
-        ).get_population_summary()
-        es.write_dataframe_with_borders(ws, "B20", summary_df)
-        es.write_dataframe_with_borders(ws, "B25", warnings_df)
+        summary_df, warnings_df = q_movements.get_population_summary()
+        ws.write_table("B20", summary_df)
+        ws.write_table("B25", warnings_df)
 
     def populate_population_summary(self, ws, *args):
-        ws["C2"].value = "Active population for the current quarter"
-        ws.range("B2:E2").merge()
-        es.header2_text_look(ws, "B2:E2")
+        ws.write("B2", "Active population for the current quarter")
+        ws.merge("B2:E2")
+        ws.style("B2:E2", "header2")
 
-        current_population = kdep.EmployeeAnalytics(
-            self.actual_df, self.dpt
+        current_population = self.context.department_analytics(
+            self.dpt
         ).get_actual_population()
-        es.write_dataframe_with_borders(ws, "B4", current_population)
+        ws.write_table("B4", current_population)
 
     def populate_comments(self, ws, *args):
-        ws["B2"].value = "Please write your comments below, based on the table formula"
-        ws.range("B2:G2").merge()
-        es.header_text_look(ws, "B2:G2")
+        ws.write("B2", "Please write your comments below, based on the table formula")
+        ws.merge("B2:G2")
+        ws.style("B2:G2", "header")
 
         com_df = pd.DataFrame(
             {
@@ -266,4 +489,4 @@ class BuildReport(fo.FilePrep):
             }
         )
 
-        es.write_dataframe_with_borders(ws, "A4", com_df)
+        ws.write_table("A4", com_df)
@@ -0,0 +1,108 @@
+"""
+@package docstring
+
+This package is responsible with the data shared by the reports of every department.
+The context reads the raw data once per snapshot pair and keeps the quarter labels, the two snapshots,
+the department list, the kpi cubes and the movement matrix, so any number of department reports can be
+built from it without touching the raw data again.
+
+"""
+
+import hashlib
+import pandas as pd
+from . import kpi_cube
+from . import kpi_department as kdep
+from . import movements as mv
+from .. import dataset_cache
+
+
+class ReportContext:
+    def __init__(self, file_prep) -> None:
+        """
+        :param file_prep: The `FilePrep` giving access to the raw data
+        """
+        self.file_name = file_prep.file_name
+        self.store = file_prep.store
+        self.last_q, self.actual_q = file_prep.map_q()
+        self.last_df, self.actual_df = file_prep.split_by_snap()
+        # the categories are shared by every snapshot, so they list the departments of the whole data
+        self.dpt_list = list(self.actual_df["department"].cat.categories)
+        self.cubes = {
+            "last": kpi_cube.KpiCube.for_frame(self.last_df),
+            "actual": kpi_cube.KpiCube.for_frame(self.actual_df),
+        }
+        self.movement_matrix = mv.MovementMatrix(self.last_df, self.actual_df)
+        self._analytics = {}
+        self._movements = {}
+        self._digests = {}
+
+    @classmethod
+    def shared(cls, file_prep):
+        """
+        The function `shared` returns the context of the raw data, building it only the first time it is
+        asked for and again when the raw data changes.
+
+        :param file_prep: The `FilePrep` giving access to the raw data
+        :return: The shared `ReportContext`.
+        """
+        return dataset_cache.get_or_load(
+            file_prep.cache_key(), lambda: cls(file_prep), variant="report_context"
+        )
+
+    def department_analytics(self, dpt) -> kdep.EmployeeAnalytics:
+        """
+        The function `department_analytics` returns the kpi of a department in the actual snapshot.
+
+        :param dpt: The department looked at
+        :return: The `EmployeeAnalytics` of the department, built once.
+        """
+        if dpt not in self._analytics:
+            self._analytics[dpt] = kdep.EmployeeAnalytics(self.actual_df, dpt)
+        return self._analytics[dpt]
+
+    def department_movements(self, dpt) -> mv.EmployeeMovements:
+        """
+        The function `department_movements` returns the movements of a department between the two
+        snapshots, sliced from the shared movement matrix.
+
+        :param dpt: The department looked at
+        :return: The `EmployeeMovements` of the department, built once.
+        """
+        if dpt not in self._movements:
+            self._movements[dpt] = mv.EmployeeMovements(
+                self.last_df, self.actual_df, dpt, matrix=self.movement_matrix
+            )
+        return self._movements[dpt]
+
+    def department_digest(self, dpt, layout_version) -> str:
+        """
+        The function `department_digest` hashes the inputs of the report of a department: its rows in
+        both snapshots, the movement rows of its employees (which carry their rows in the other
+        departments, e.g. for lateral moves), the quarter labels and the version of the report layout.
+
+        :param dpt: The department looked at
+        :param layout_version: The version of the report layout, changed whenever the reports change
+        :return: The hexadecimal SHA-256 digest of the inputs.
+        """
+        key = (dpt, layout_version)
+        if key not in self._digests:
+            digest = hashlib.sha256()
+            digest.update(
+                repr((layout_version, self.last_q, self.actual_q)).encode("utf-8")
+            )
+            movements = self.movement_matrix.rows_of(dpt)
+            # the row positions change with the rows of every department, they are left out
+            movements = movements.drop(
+                columns=[col for col in movements.columns if col.startswith("_pos")]
+            )
+            for rows in (
+                self.last_df[self.last_df["department"] == dpt],
+                self.actual_df[self.actual_df["department"] == dpt],
+                movements,
+            ):
+                digest.update(repr(list(rows.columns)).encode("utf-8"))
+                digest.update(
+                    pd.util.hash_pandas_object(rows, index=False).to_numpy().tobytes()
+                )
+            self._digests[key] = digest.hexdigest()
+        return self._digests[key]
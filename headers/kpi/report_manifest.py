@@ -0,0 +1,71 @@
+"""
+@package docstring
+
+This package is responsible with the manifest of the generated reports.
+The manifest is a JSON file next to the reports that keeps, for every report file, the hash of the
+inputs it was built from. A report whose inputs hash the same as in the manifest, and whose file is
+still there, does not need to be built again.
+
+"""
+
+import json
+import os
+import threading
+
+MANIFEST_NAME = "manifest.json"
+
+
+class ReportManifest:
+    def __init__(self, folder: str) -> None:
+        """
+        :param folder: The folder holding the reports and the manifest
+        """
+        self.folder = folder
+        self.path = os.path.join(folder, MANIFEST_NAME)
+        self._lock = threading.Lock()
+        self.entries = self._load()
+
+    def _load(self) -> dict:
+        try:
+            with open(self.path, "r") as manifest_file:
+                content = json.load(manifest_file)
+        except (OSError, ValueError):
+            return {}
+        reports = content.get("reports") if isinstance(content, dict) else None
+        return reports if isinstance(reports, dict) else {}
+
+    def is_current(self, report_path: str, digest: str) -> bool:
+        """
+        The function `is_current` tells if a report was already built from the same inputs.
+
+        :param report_path: The path of the report file
+        :param digest: The hash of the inputs of the report
+        :return: True if the manifest holds the same hash and the file exists, False otherwise.
+        """
+        return self.entries.get(
+            os.path.basename(report_path)
+        ) == digest and os.path.exists(report_path)
+
+    def record(self, report_path: str, digest: str) -> None:
+        """
+        The function `record` stores the hash of the inputs of a report that was just built and saves
+        the manifest.
+
+        :param report_path: The path of the report file
+        :param digest: The hash of the inputs of the report
+        """
+        with self._lock:
+            self.entries[os.path.basename(report_path)] = digest
+            self.save()
+
+    def save(self) -> None:
+        """
+        The function `save` writes the manifest, replacing the previous one only once it is complete.
+        """
+        os.makedirs(self.folder, exist_ok=True)
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w") as manifest_file:
+            json.dump(
+                {"reports": self.entries}, manifest_file, indent=4, sort_keys=True
+            )
+        os.replace(temp_path, self.path)
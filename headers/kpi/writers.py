@@ -0,0 +1,461 @@
+"""
+@package docstring
+
+This package is responsible with writing the report workbooks.
+The report is described through a small interface (sheets, values, merges, header styles and bordered
+tables) and written by a pluggable backend: XlsxWriter, which writes the cells as they come and
+needs no Excel, xlwings, which drives an Excel instance and stays available where
+Excel is installed, or HTML, which renders the same sections with a Jinja2 template for previews and
+mails.
+
+"""
+
+import abc
+import functools
+import io
+import os
+import re
+import pandas as pd
+from . import excel_styles as es
+
+try:
+    import xlsxwriter
+
+    XLSXWRITER_AVAILABLE = True
+except ImportError:
+    XLSXWRITER_AVAILABLE = False
+
+try:
+    import xlwings as xw
+
+    XLWINGS_AVAILABLE = True
+except ImportError:
+    XLWINGS_AVAILABLE = False
+
+try:
+    import jinja2
+
+    JINJA2_AVAILABLE = True
+except ImportError:
+    JINJA2_AVAILABLE = False
+
+
+XLSXWRITER = "xlsxwriter"
+XLWINGS = "xlwings"
+HTML = "html"
+
+TEMPLATE_FOLDER = "headers/kpi/templates"
+REPORT_TEMPLATE = "report.html"
+STYLE_DOC = "headers/kpi/style_doc.html"
+
+MIN_COLUMN_WIDTH = 8
+MAX_COLUMN_WIDTH = 60
+
+
+def default_backend() -> str:
+    """
+    The function `default_backend` picks the report writer to use when none is asked for.
+    :return: "xlsxwriter" when the package is installed, "xlwings" otherwise.
+    """
+    return XLSXWRITER if XLSXWRITER_AVAILABLE else XLWINGS
+
+
+def extension_of(backend: str = None) -> str:
+    """
+    The function `extension_of` gives the file extension of the reports written by a backend.
+    :param backend: The report writer, defaults to `default_backend()`
+    :return: ".html" for the HTML writer, ".xlsx" otherwise.
+    """
+    return ".html" if backend == HTML else ".xlsx"
+
+
+def open_writer(backend: str = None):
+    """
+    The function `open_writer` starts a report workbook with the given backend.
+
+    :param backend: "xlsxwriter", "xlwings" or "html", defaults to `default_backend()`
+    :type backend: str
+    :return: A `ReportWriter`, to be used as a context manager.
+    :raises ValueError: If the backend is unknown.
+    :raises ImportError: If the package of the backend is not installed.
+    """
+    backend = backend or default_backend()
+    writers = {
+        XLSXWRITER: XlsxReportWriter,
+        XLWINGS: XlwingsReportWriter,
+        HTML: HtmlReportWriter,
+    }
+    available = {
+        XLSXWRITER: XLSXWRITER_AVAILABLE,
+        XLWINGS: XLWINGS_AVAILABLE,
+        HTML: JINJA2_AVAILABLE,
+    }
+    if backend not in writers:
+        raise ValueError(f"Unknown report writer {backend}, use one of {list(writers)}")
+    if not available[backend]:
+        package = "jinja2" if backend == HTML else backend
+        raise ImportError(f"The {backend} report writer needs the {package} package")
+    return writers[backend]()
+
+
+def _cell_position(cell: str) -> tuple:
+    # "B4" -> (3, 1), zero based row and column
+    found = re.fullmatch(r"\$?([A-Za-z]+)\$?(\d+)", cell.strip())
+    if found is None:
+        raise ValueError(f"{cell} is not a cell address")
+    col = 0
+    for letter in found.group(1).upper():
+        col = col * 26 + ord(letter) - ord("A") + 1
+    return int(found.group(2)) - 1, col - 1
+
+
+def _range_bounds(cell_range: str) -> tuple:
+    # "B2:D3" -> (1, 1, 2, 3), the first and the last row and column of the range
+    first, _, last = cell_range.partition(":")
+    return _cell_position(first) + _cell_position(last or first)
+
+
+class ReportSheet(abc.ABC):
+    @abc.abstractmethod
+    def write(self, cell: str, value) -> None:
+        """
+        Write a single value, e.g. a title, to a cell such as "B2".
+        """
+
+    @abc.abstractmethod
+    def merge(self, cell_range: str) -> None:
+        """
+        Merge the cells of a range such as "B2:D2".
+        """
+
+    @abc.abstractmethod
+    def style(self, cell_range: str, style: str = "header") -> None:
+        """
+        Apply one of the named styles of `excel_styles.STYLES` to a whole range.
+        """
+
+    @abc.abstractmethod
+    def write_table(self, cell: str, df: pd.DataFrame) -> None:
+        """
+        Write a DataFrame with its header and without its index, starting at `cell`, with borders
+        around every cell. Nothing is written when `df` is `None`.
+        """
+
+
+class ReportWriter(abc.ABC):
+    @abc.abstractmethod
+    def add_sheet(self, name: str) -> ReportSheet:
+        """
+        Add a sheet after the existing ones.
+        """
+
+    @abc.abstractmethod
+    def save(self, path: str) -> None:
+        """
+        Save the workbook to `path`.
+        """
+
+    def close(self) -> None:
+        """
+        Release the resources held by the writer.
+        """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+
+class _XlsxSheet(ReportSheet):
+    # cells are written to the worksheet as they come; only the titles (to restyle them and to fill the
+    # merged ranges), the style names of styled cells and the column widths are kept
+    def __init__(self, worksheet, cell_format) -> None:
+        self.worksheet = worksheet
+        self.cell_format = cell_format
+        self.titles = {}
+        self.styles = {}
+        self.merges = {}
+        self.widths = {}
+
+    def _write_cell(self, row, col, value):
+        value = _cell_value(value)
+        cell_format = self.cell_format(self.styles.get((row, col), ()))
+        if value is None:
+            self.worksheet.write_blank(row, col, None, cell_format)
+        else:
+            self.worksheet.write(row, col, value, cell_format)
+
+    def _measure(self, col, value):
+        if value is not None:
+            self.widths[col] = max(self.widths.get(col, 0), len(str(value)))
+
+    def write(self, cell, value):
+        row, col = _cell_position(cell)
+        self.titles[(row, col)] = value
+        self._write_cell(row, col, value)
+
+    def merge(self, cell_range):
+        first_row, first_col, last_row, last_col = _range_bounds(cell_range)
+        self.merges[(first_row, first_col)] = (last_row, last_col)
+
+    def style(self, cell_range, style="header"):
+        if style not in es.STYLES:
+            raise KeyError(style)
+        first_row, first_col, last_row, last_col = _range_bounds(cell_range)
+        for row in range(first_row, last_row + 1):
+            for col in range(first_col, last_col + 1):
+                styles = self.styles.get((row, col), ())
+                if style not in styles:
+                    self.styles[(row, col)] = styles + (style,)
+                self._write_cell(row, col, self.titles.get((row, col)))
+
+    def write_table(self, cell, df):
+        if df is None:
+            return
+        first_row, first_col = _cell_position(cell)
+        values = df.astype(object).where(df.notna(), None).to_numpy()
+        rows = [list(df.columns)] + values.tolist()
+        table_format = self.cell_format(("table",))
+        for row_offset, row_values in enumerate(rows):
+            row = first_row + row_offset
+            for col_offset, value in enumerate(row_values):
+                col = first_col + col_offset
+                value = _cell_value(value)
+                self._measure(col, value)
+                if (row, col) in self.styles:
+                    self.styles[(row, col)] += ("table",)
+                    self._write_cell(row, col, value)
+                elif value is None:
+                    self.worksheet.write_blank(row, col, None, table_format)
+                else:
+                    self.worksheet.write(row, col, value, table_format)
+
+    def finish(self) -> None:
+        for (row, col), (last_row, last_col) in self.merges.items():
+            value = _cell_value(self.titles.get((row, col)))
+            self.worksheet.merge_range(
+                row,
+                col,
+                last_row,
+                last_col,
+                "" if value is None else value,
+                self.cell_format(self.styles.get((row, col), ())),
+            )
+
+        # a merged title spreads over several columns, it does not widen its first one
+        for (row, col), value in self.titles.items():
+            if (row, col) not in self.merges:
+                self._measure(col, _cell_value(value))
+        for col, width in self.widths.items():
+            self.worksheet.set_column(
+                col, col, min(max(width + 2, MIN_COLUMN_WIDTH), MAX_COLUMN_WIDTH)
+            )
+
+
+def _cell_value(value):
+    if hasattr(value, "item"):
+        value = value.item()
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return value
+    return str(value)
+
+
+class XlsxReportWriter(ReportWriter):
+    # the workbook is built in memory and written to its file on save, as the path is only known then
+    def __init__(self) -> None:
+        self.output = io.BytesIO()
+        self.workbook = xlsxwriter.Workbook(self.output, {"in_memory": True})
+        self.sheets = []
+        self.formats = {}
+
+    def cell_format(self, styles):
+        """
+        Return the workbook format of a combination of style names, created once per workbook.
+        """
+        if styles and styles not in self.formats:
+            self.formats[styles] = self.workbook.add_format(es.xlsx_format(*styles))
+        return self.formats.get(styles)
+
+    def add_sheet(self, name):
+        sheet = _XlsxSheet(self.workbook.add_worksheet(name), self.cell_format)
+        self.sheets.append(sheet)
+        return sheet
+
+    def save(self, path):
+        for sheet in self.sheets:
+            sheet.finish()
+        self.workbook.close()
+
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        with open(path, "wb") as report_file:
+            report_file.write(self.output.getvalue())
+
+    def close(self):
+        self.output.close()
+
+
+class _XlwingsSheet(ReportSheet):
+    def __init__(self, worksheet) -> None:
+        self.worksheet = worksheet
+
+    def write(self, cell, value):
+        self.worksheet[cell].value = value
+
+    def merge(self, cell_range):
+        self.worksheet.range(cell_range).merge()
+
+    def style(self, cell_range, style="header"):
+        es.apply_style(self.worksheet.range(cell_range), style)
+
+    def write_table(self, cell, df):
+        if df is not None:
+            es.write_dataframe_with_borders(self.worksheet, cell, df)
+
+
+class XlwingsReportWriter(ReportWriter):
+    def __init__(self) -> None:
+        self.app = xw.App(visible=False)
+        self.book = self.app.books.add()
+        self.app.display_alerts = False
+        es.register_styles(self.book)
+        self.sheets = []
+
+    def add_sheet(self, name):
+        worksheet = self.book.sheets.add(name=name, after=self.book.sheets[-1])
+        self.sheets.append(worksheet)
+        return _XlwingsSheet(worksheet)
+
+    def save(self, path):
+        for sheet in self.book.sheets:
+            sheet.autofit()
+            sheet.range("A1").expand().api.HorizontalAlignment = (
+                xw.constants.HAlign.xlHAlignCenter
+            )
+
+        if "Sheet1" in [sheet.name for sheet in self.book.sheets]:
+            self.book.sheets["Sheet1"].delete()
+
+        if self.sheets:
+            self.sheets[0].activate()
+        self.book.save(path)
+
+    def close(self):
+        self.app.display_alerts = True
+        self.book.close()
+        self.app.quit()
+
+
+@functools.lru_cache(maxsize=None)
+def report_template():
+    """
+    The function `report_template` compiles the HTML report template once per process.
+    :return: The compiled Jinja2 `Template`.
+    """
+    environment = jinja2.Environment(
+        loader=jinja2.FileSystemLoader(TEMPLATE_FOLDER),
+        autoescape=True,
+        trim_blocks=True,
+        lstrip_blocks=True,
+    )
+    return environment.get_template(REPORT_TEMPLATE)
+
+
+@functools.lru_cache(maxsize=None)
+def report_css() -> str:
+    """
+    The function `report_css` reads the style sheet of headers/kpi/style_doc.html once per process, so
+    the HTML reports use the same colours as the documented Excel styles.
+    :return: The content of the <style> element, or an empty string if the file can not be read.
+    """
+    try:
+        with open(STYLE_DOC, "r", encoding="utf-8") as style_file:
+            found = re.search(r"<style>(.*?)</style>", style_file.read(), re.S)
+    except OSError:
+        return ""
+    return found.group(1) if found else ""
+
+
+def _html_value(value):
+    value = _cell_value(value)
+    if value is None:
+        return ""
+    if isinstance(value, float):
+        return f"{value:.2f}".rstrip("0").rstrip(".")
+    return value
+
+
+class _HtmlSheet(ReportSheet):
+    # the sheet keeps its titles and tables by position and renders them top to bottom, left to right
+    def __init__(self, name) -> None:
+        self.name = name
+        self.blocks = {}
+
+    def write(self, cell, value):
+        self.blocks[_cell_position(cell)] = {
+            "kind": "title",
+            "text": _html_value(value),
+            "css_class": "",
+        }
+
+    def merge(self, cell_range):
+        pass
+
+    def style(self, cell_range, style="header"):
+        css_class = es.STYLES[style].get("css_class", "")
+        first_row, first_col, last_row, last_col = _range_bounds(cell_range)
+        for (row, col), block in self.blocks.items():
+            if (
+                block["kind"] == "title"
+                and first_row <= row <= last_row
+                and first_col <= col <= last_col
+            ):
+                block["css_class"] = css_class
+
+    def write_table(self, cell, df):
+        if df is None:
+            return
+        values = df.astype(object).where(df.notna(), None).to_numpy().tolist()
+        self.blocks[_cell_position(cell)] = {
+            "kind": "table",
+            "columns": [_html_value(column) for column in df.columns],
+            "rows": [[_html_value(value) for value in row] for row in values],
+            "css_class": es.STYLES["table"]["css_class"],
+        }
+
+    def context(self) -> dict:
+        return {
+            "name": self.name,
+            "blocks": [self.blocks[position] for position in sorted(self.blocks)],
+        }
+
+
+class HtmlReportWriter(ReportWriter):
+    def __init__(self) -> None:
+        self.sheets = []
+
+    def add_sheet(self, name):
+        sheet = _HtmlSheet(name)
+        self.sheets.append(sheet)
+        return sheet
+
+    def render(self, title: str) -> str:
+        """
+        Render every sheet of the report as one HTML page.
+        """
+        return report_template().render(
+            title=title,
+            css=report_css(),
+            sheets=[sheet.context() for sheet in self.sheets],
+        )
+
+    def save(self, path):
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        title = os.path.splitext(os.path.basename(path))[0]
+        with open(path, "w", encoding="utf-8") as html_file:
+            html_file.write(self.render(title))
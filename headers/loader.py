@@ -0,0 +1,127 @@
+import codecs
+import functools
+import os
+import pandas as pd
+from logs import logger_class
+from . import dataset_cache
+
+"""
+@package docstring
+
+This file reads tabular files (raw data and uploads) without guessing by trial and error.
+The format is detected from the first bytes of the file and the extension, the encoding of text files
+from a sample, and the result is cached per file so the detection is done once. A text file that stops
+being UTF-8 after the sample is read again as Latin-1.
+
+"""
+
+
+SAMPLE_SIZE = 64 * 1024
+
+_MAGIC_NUMBERS = (
+    (b"PK\x03\x04", "xlsx"),
+    (b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1", "xls"),
+    (b"PAR1", "parquet"),
+)
+
+_TEXT_BOMS = (
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+)
+
+_EXTENSIONS = {
+    ".xlsx": "xlsx",
+    ".xlsm": "xlsx",
+    ".xls": "xls",
+    ".parquet": "parquet",
+    ".csv": "csv",
+    ".txt": "csv",
+}
+
+
+def sniff(path: str) -> tuple:
+    """
+    The function `sniff` detects the format and, for text files, the encoding of a file.
+
+    :param path: The path of the file to inspect
+    :type path: str
+    :return: A `(file_format, encoding)` tuple, where `file_format` is one of "xlsx", "xls", "parquet"
+    or "csv" and `encoding` is `None` for binary formats.
+    """
+    signature = dataset_cache.file_signature(path)
+    if signature is None:
+        raise FileNotFoundError(path)
+    return _sniff(os.path.abspath(path), *signature)
+
+
+@functools.lru_cache(maxsize=64)
+def _sniff(abs_path: str, mtime_ns: int, size: int) -> tuple:
+    with open(abs_path, "rb") as source:
+        sample = source.read(SAMPLE_SIZE)
+
+    for magic, file_format in _MAGIC_NUMBERS:
+        if sample.startswith(magic):
+            return file_format, None
+
+    extension = os.path.splitext(abs_path)[1].lower()
+    file_format = _EXTENSIONS.get(extension, "csv")
+    if file_format != "csv":
+        raise ValueError(f"{abs_path} does not look like a valid {extension} file")
+
+    return file_format, _detect_encoding(sample)
+
+
+def _detect_encoding(sample: bytes) -> str:
+    """
+    The function `_detect_encoding` picks the encoding of a text sample: a byte order mark wins, then
+    UTF-8 if the sample decodes cleanly, and Latin-1 otherwise (Latin-1 can decode any byte).
+
+    :param sample: The first bytes of the file
+    :type sample: bytes
+    :return: The name of the encoding.
+    """
+    for bom, encoding in _TEXT_BOMS:
+        if sample.startswith(bom):
+            return encoding
+
+    try:
+        # the sample may end in the middle of a multi-byte character, so it is not decoded as final
+        codecs.getincrementaldecoder("utf-8")().decode(sample, final=False)
+        return "utf-8"
+    except UnicodeDecodeError:
+        return "latin-1"
+
+
+def read_table(path: str, columns=None) -> pd.DataFrame:
+    """
+    The function `read_table` reads a file into a DataFrame with the reader matching its detected format.
+    A text file detected as UTF-8 that fails to decode after the sample is read again as Latin-1.
+
+    :param path: The path of the file to read
+    :type path: str
+    :param columns: The columns to read; every column is read when `None`, defaults to None
+    :return: A pandas DataFrame with the contents of the file.
+    :raises ValueError: If the extension of the file does not match its content.
+    """
+    file_format, encoding = sniff(path)
+    usecols = None if columns is None else list(columns)
+
+    if file_format in ("xlsx", "xls"):
+        return pd.read_excel(path, usecols=usecols)
+    if file_format == "parquet":
+        return pd.read_parquet(path, columns=usecols)
+    try:
+        return pd.read_csv(path, encoding=encoding, usecols=usecols, low_memory=False)
+    except UnicodeDecodeError:
+        if encoding != "utf-8":
+            raise
+        content = pd.read_csv(
+            path, encoding="latin-1", usecols=usecols, low_memory=False
+        )
+        grab_logs = logger_class.GrabLogs()
+        grab_logs.form_log(
+            "Content converted to Latin-1 due to encoding issues",
+            grab_logs.get_level("warn"),
+        )
+        return content
@@ -0,0 +1,142 @@
+import functools
+import json
+import numpy as np
+import pandas as pd
+
+"""
+@package docstring
+
+This file turns pay grades into integer ordinals and defines the management bands on top of them.
+The bands (e.g. LM = G34-G36, UM = G37-G41) are read once from headers/mapping/bands.json, so band
+membership is an integer range check and promotions are an integer comparison.
+
+"""
+
+
+GRADE_COLUMN = "pay_grade"
+ORDINAL_COLUMN = "pay_grade_num"
+
+# ordinal used for missing or unparseable pay grades
+NO_GRADE = -1
+
+
+def parse_grade(grade) -> int:
+    """
+    The function `parse_grade` converts a single pay grade to its ordinal.
+
+    :param grade: A pay grade such as "G37"
+    :return: The integer part of the grade (e.g. 37), or `NO_GRADE` if it can not be parsed.
+    """
+    digits = "".join(ch for ch in str(grade) if ch.isdigit())
+    return int(digits) if digits else NO_GRADE
+
+
+def grade_ordinals(grades: pd.Series) -> pd.Series:
+    """
+    The function `grade_ordinals` converts a column of pay grades to ordinals in a single pass: each
+    distinct grade is parsed once and the result is spread with the categorical codes.
+
+    :param grades: A column of pay grades, categorical or not
+    :type grades: pd.Series
+    :return: An int16 Series with the ordinal of each grade.
+    """
+    if not isinstance(grades.dtype, pd.CategoricalDtype):
+        grades = grades.astype("category")
+    lookup = np.array(
+        [parse_grade(grade) for grade in grades.cat.categories] + [NO_GRADE],
+        dtype="int16",
+    )
+    # code -1 (missing grade) picks the trailing NO_GRADE entry of the lookup
+    return pd.Series(lookup[grades.cat.codes.to_numpy()], index=grades.index)
+
+
+def with_ordinals(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    The function `with_ordinals` makes sure a DataFrame carries the pay grade ordinal column.
+
+    :param df: A raw data like DataFrame
+    :type df: pd.DataFrame
+    :return: `df` itself if it already has the column or has no pay grades, otherwise a shallow copy
+    with the column added.
+    """
+    if ORDINAL_COLUMN in df.columns or GRADE_COLUMN not in df.columns:
+        return df
+    df = df.copy(deep=False)
+    df[ORDINAL_COLUMN] = grade_ordinals(df[GRADE_COLUMN])
+    return df
+
+
+@functools.lru_cache(maxsize=None)
+def load_bands(band_map="headers/mapping/bands.json") -> dict:
+    """
+    The function `load_bands` reads the band definitions once.
+
+    :param band_map: The path of the JSON file mapping each band to its lowest and highest grade,
+    defaults to headers/mapping/bands.json (optional)
+    :return: A dictionary mapping each band name to a `(lowest, highest)` tuple of ordinals.
+    """
+    with open(band_map, "r") as band_file:
+        content = json.load(band_file)
+    return {
+        band: (parse_grade(limits[0]), parse_grade(limits[1]))
+        for band, limits in content.items()
+    }
+
+
+def band_limits(band: str) -> tuple:
+    """
+    The function `band_limits` returns the ordinal range of a band.
+
+    :param band: The name of the band, e.g. "UM"
+    :type band: str
+    :return: A `(lowest, highest)` tuple of ordinals.
+    :raises KeyError: If the band is not defined in the band map.
+    """
+    bands = load_bands()
+    if band not in bands:
+        raise KeyError(f"Band '{band}' is not defined in {list(bands)}")
+    return bands[band]
+
+
+def band_grades(band: str) -> list:
+    """
+    The function `band_grades` lists the pay grades of a band, for display.
+
+    :param band: The name of the band, e.g. "LM"
+    :type band: str
+    :return: A list of pay grades such as ["G34", "G35", "G36"].
+    """
+    lowest, highest = band_limits(band)
+    return [f"G{grade}" for grade in range(lowest, highest + 1)]
+
+
+def band_mask(df: pd.DataFrame, band: str) -> pd.Series:
+    """
+    The function `band_mask` selects the rows of a DataFrame that belong to a band.
+
+    :param df: A raw data like DataFrame, with or without the ordinal column
+    :type df: pd.DataFrame
+    :param band: The name of the band, e.g. "UM"
+    :type band: str
+    :return: A boolean Series aligned with `df`.
+    """
+    lowest, highest = band_limits(band)
+    ordinals = with_ordinals(df)[ORDINAL_COLUMN]
+    return (ordinals >= lowest) & (ordinals <= highest)
+
+
+def band_of(ordinals: pd.Series) -> pd.Series:
+    """
+    The function `band_of` assigns every pay grade ordinal to its band.
+
+    :param ordinals: A column of pay grade ordinals
+    :type ordinals: pd.Series
+    :return: A categorical Series with the band name of each row, missing for grades outside every band.
+    """
+    bands = load_bands()
+    values = ordinals.to_numpy()
+    conditions = [(values >= low) & (values <= high) for low, high in bands.values()]
+    labels = np.select(conditions, list(bands), default="")
+    return pd.Series(
+        pd.Categorical(labels, categories=list(bands)), index=ordinals.index
+    )
@@ -0,0 +1,147 @@
+import calendar
+import functools
+import json
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from . import schema
+
+"""
+@package docstring
+
+This file maps snapshot dates to quarters.
+The calendar is loaded once from headers/mapping/quarters.json (or built for any fiscal year start) and
+labels whole columns of snapshot dates with a single array operation instead of looking every value up
+in the JSON file.
+
+"""
+
+
+_MONTH_NUMBERS = {
+    name: number for number, name in enumerate(calendar.month_name) if name
+}
+
+
+class QuarterCalendar:
+    def __init__(self, start_month=1) -> None:
+        """
+        :param start_month: The month (1-12) the first quarter of the year starts with. Fiscal years not
+        starting in January are named after the calendar year they end in.
+        """
+        if not 1 <= start_month <= 12:
+            raise ValueError(f"start_month must be between 1 and 12, not {start_month}")
+        self.start_month = start_month
+
+    @classmethod
+    def from_json(cls, q_map="headers/mapping/quarters.json"):
+        """
+        The function `from_json` builds the calendar described by a quarter-month mapping file.
+
+        :param q_map: The path to a JSON file mapping every year to its quarters and every quarter to its
+        months, defaults to headers/mapping/quarters.json (optional)
+        :return: A `QuarterCalendar` whose first quarter starts with the first month of "Q1".
+        :raises ValueError: If the quarters of a year are not three consecutive months each.
+        """
+        with open(q_map, "r") as q_map_file:
+            content = json.load(q_map_file)
+
+        start_months = set()
+        for year, quarters in content.items():
+            months = [
+                _MONTH_NUMBERS[month] for q in sorted(quarters) for month in quarters[q]
+            ]
+            expected = [(months[0] - 1 + step) % 12 + 1 for step in range(12)]
+            if months != expected:
+                raise ValueError(
+                    f"The quarters of {year} in {q_map} are not consecutive"
+                )
+            start_months.add(months[0])
+
+        if len(start_months) > 1:
+            raise ValueError(f"The years in {q_map} do not share the same first month")
+        return cls(start_months.pop() if start_months else 1)
+
+    def quarters_of(self, months, years) -> tuple:
+        """
+        The function `quarters_of` maps arrays of months and years to quarters.
+
+        :param months: An array of month numbers (1-12)
+        :param years: An array of calendar years
+        :return: A `(quarters, fiscal_years)` tuple of integer arrays.
+        """
+        months = np.asarray(months, dtype=np.int64)
+        years = np.asarray(years, dtype=np.int64)
+        shifted = (months - self.start_month) % 12
+        quarters = shifted // 3 + 1
+        fiscal_years = years + ((self.start_month > 1) & (months >= self.start_month))
+        return quarters, fiscal_years
+
+    def label(self, snapshots) -> pd.DataFrame:
+        """
+        The function `label` assigns a quarter and a year to every snapshot date of a column.
+        Each distinct snapshot is parsed once; the labels are then spread with the factorized codes.
+
+        :param snapshots: A Series (categorical or not) of "Mon-YYYY" snapshot dates
+        :return: A DataFrame aligned with `snapshots` with the columns "quarter" (e.g. "Q3") and "year"
+        (e.g. "2024"); values that can not be parsed are left missing.
+        """
+        snapshots = pd.Series(snapshots)
+        if isinstance(snapshots.dtype, pd.CategoricalDtype):
+            codes = snapshots.cat.codes.to_numpy()
+            uniques = snapshots.cat.categories
+        else:
+            codes, uniques = pd.factorize(snapshots)
+
+        dates = pd.to_datetime(
+            pd.Series(uniques, dtype=object),
+            format=schema.SNAPSHOT_FORMAT,
+            errors="coerce",
+        )
+        valid = dates.notna().to_numpy()
+        quarters, years = self.quarters_of(
+            dates.dt.month.fillna(1).to_numpy(), dates.dt.year.fillna(0).to_numpy()
+        )
+        quarter_labels = np.where(valid, np.char.add("Q", quarters.astype(str)), None)
+        year_labels = np.where(valid, years.astype(str), None)
+
+        # code -1 (missing snapshot) picks the trailing None of the labels
+        quarter_labels = np.append(quarter_labels, None)
+        year_labels = np.append(year_labels, None)
+        return pd.DataFrame(
+            {"quarter": quarter_labels[codes], "year": year_labels[codes]},
+            index=snapshots.index,
+        )
+
+    def quarter_for_snap(self, month_snap):
+        """
+        The function `quarter_for_snap` determines the quarter of a single snapshot date.
+
+        :param month_snap: A snapshot date in the format "Mon-YYYY" (e.g. "Jan-2024")
+        :return: A `(quarter, year)` tuple such as ("Q1", "2024"), or `None` if it can not be parsed.
+        """
+        labels = self.label(pd.Series([month_snap], dtype=object)).iloc[0]
+        if labels["quarter"] is None:
+            return None
+        return labels["quarter"], labels["year"]
+
+    def quarter_of_date(self, moment: datetime) -> tuple:
+        """
+        The function `quarter_of_date` determines the quarter of a date.
+
+        :param moment: The date looked at
+        :type moment: datetime
+        :return: A `(quarter, year)` tuple such as ("Q1", "2024").
+        """
+        quarters, years = self.quarters_of([moment.month], [moment.year])
+        return f"Q{quarters[0]}", str(years[0])
+
+
+@functools.lru_cache(maxsize=None)
+def default_calendar(q_map="headers/mapping/quarters.json") -> QuarterCalendar:
+    """
+    The function `default_calendar` loads the calendar of the application once.
+
+    :param q_map: The path to the quarter-month mapping file, defaults to headers/mapping/quarters.json
+    :return: The shared `QuarterCalendar`.
+    """
+    return QuarterCalendar.from_json(q_map)
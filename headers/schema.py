@@ -0,0 +1,139 @@
+import numpy as np
+import pandas as pd
+from . import pay_grades
+
+"""
+@package docstring
+
+This file declares the column types of the raw data and applies them at load time.
+The low-cardinality columns used by every KPI filter become pandas categoricals and employee_id a compact
+integer, which shrinks the data in memory and makes boolean masks and groupbys much cheaper.
+
+"""
+
+
+CATEGORY_COLUMNS = ("department", "market", "gender")
+
+# every pay grade the organisation uses, from the lowest to the highest
+PAY_GRADES = tuple(f"G{grade}" for grade in range(1, 51))
+
+EMPLOYEE_ID_DTYPE = "int32"
+
+SNAPSHOT_FORMAT = "%b-%Y"
+
+
+def category_values(df: pd.DataFrame) -> dict:
+    """
+    The function `category_values` lists the values found in the categorical columns of a DataFrame.
+
+    :param df: A raw data like DataFrame
+    :type df: pd.DataFrame
+    :return: A dictionary mapping each column of `CATEGORY_COLUMNS` present in `df` to the sorted list of
+    its values.
+    """
+    return {
+        col: sorted(str(val) for val in df[col].dropna().unique())
+        for col in CATEGORY_COLUMNS
+        if col in df.columns
+    }
+
+
+def merge_category_values(known: dict, new: dict) -> dict:
+    """
+    The function `merge_category_values` unites two dictionaries built by `category_values`.
+
+    :param known: The values recorded so far
+    :type known: dict
+    :param new: The values found in new data
+    :type new: dict
+    :return: A dictionary with the sorted union of the values of each column.
+    """
+    merged = {col: list(values) for col, values in known.items()}
+    for col, values in new.items():
+        merged[col] = sorted(set(merged.get(col, [])) | set(values))
+    return merged
+
+
+def sort_snapshots(snapshots) -> list:
+    """
+    The function `sort_snapshots` orders snapshot_date values chronologically. Values that can not be
+    parsed as "Mon-YYYY" keep their relative order and are placed last.
+
+    :param snapshots: An iterable of snapshot_date values
+    :return: The sorted list of snapshot_date values.
+    """
+    snapshots = list(dict.fromkeys(snapshots))
+    parsed = pd.to_datetime(
+        pd.Series(snapshots, dtype=object), format=SNAPSHOT_FORMAT, errors="coerce"
+    )
+    order = parsed.sort_values(kind="stable", na_position="last").index
+    return [snapshots[idx] for idx in order]
+
+
+def _as_category(values: pd.Series, categories, ordered=False) -> pd.Series:
+    """
+    The function `_as_category` converts a column to a categorical, adding any value missing from
+    `categories` at the end so no data is lost.
+    """
+    categories = list(categories)
+    known = set(categories)
+    unknown = [val for val in pd.unique(values.dropna()) if val not in known]
+    return pd.Series(
+        pd.Categorical(values, categories=categories + unknown, ordered=ordered),
+        index=values.index,
+        name=values.name,
+    )
+
+
+def apply_schema(df: pd.DataFrame, categories: dict = None) -> pd.DataFrame:
+    """
+    The function `apply_schema` converts the columns of a raw data like DataFrame to their declared types.
+
+    - department, market and gender become categoricals
+    - pay_grade becomes an ordered categorical following `PAY_GRADES`, and its integer ordinal is added
+      as the pay_grade_num column
+    - snapshot_date becomes an ordered categorical in chronological order
+    - employee_id becomes a 32 bit integer
+
+    :param df: A raw data like DataFrame
+    :type df: pd.DataFrame
+    :param categories: The categories to use for each categorical column (including "snapshot_date"), so
+    frames loaded separately share the same categories. The values of `df` are used when it is `None`,
+    defaults to None (optional)
+    :type categories: dict
+    :return: The converted DataFrame, or `None` if `df` is `None`.
+    """
+    if df is None:
+        return None
+
+    categories = categories or {}
+    df = df.copy(deep=False)
+
+    for col in CATEGORY_COLUMNS:
+        if col in df.columns:
+            col_categories = categories.get(col) or category_values(df)[col]
+            df[col] = _as_category(df[col], col_categories)
+
+    if "pay_grade" in df.columns:
+        df["pay_grade"] = _as_category(df["pay_grade"], PAY_GRADES, ordered=True)
+        df[pay_grades.ORDINAL_COLUMN] = pay_grades.grade_ordinals(df["pay_grade"])
+
+    if "snapshot_date" in df.columns:
+        snapshots = categories.get("snapshot_date") or pd.unique(
+            df["snapshot_date"].dropna()
+        )
+        df["snapshot_date"] = _as_category(
+            df["snapshot_date"], sort_snapshots(snapshots), ordered=True
+        )
+
+    if "employee_id" in df.columns and df["employee_id"].notna().all():
+        ids = pd.to_numeric(df["employee_id"], errors="coerce")
+        id_limits = np.iinfo(EMPLOYEE_ID_DTYPE)
+        if (
+            ids.notna().all()
+            and (ids % 1 == 0).all()
+            and ids.between(id_limits.min, id_limits.max).all()
+        ):
+            df["employee_id"] = ids.astype(EMPLOYEE_ID_DTYPE)
+
+    return df
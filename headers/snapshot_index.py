@@ -0,0 +1,121 @@
+import numpy as np
+import pandas as pd
+from . import schema
+
+"""
+@package docstring
+
+This file indexes the snapshots of the raw data.
+The data is kept sorted chronologically by snapshot_date, so the rows of every snapshot form one
+contiguous block; the index records where each block starts and ends, and selecting a snapshot (or the
+last two of them) becomes a positional slice instead of a comparison over the whole column.
+
+"""
+
+
+SNAP_COLUMN = "snapshot_date"
+
+
+def _sort_keys(snapshots: pd.Series) -> np.ndarray:
+    """
+    The function `_sort_keys` returns the chronological position of every row, rows without a snapshot
+    getting the last position.
+    """
+    codes = snapshots.cat.codes.to_numpy()
+    return np.where(codes < 0, len(snapshots.cat.categories), codes)
+
+
+def sort_frame(df: pd.DataFrame, snap_column=SNAP_COLUMN) -> pd.DataFrame:
+    """
+    The function `sort_frame` orders the rows of a typed DataFrame chronologically by snapshot, keeping
+    the original order inside each snapshot.
+
+    :param df: A DataFrame whose snapshot column is an ordered categorical (see `schema.apply_schema`)
+    :type df: pd.DataFrame
+    :return: `df` itself if it is already sorted, otherwise a sorted copy.
+    """
+    if df is None or snap_column not in df.columns:
+        return df
+    keys = _sort_keys(df[snap_column])
+    if np.all(keys[:-1] <= keys[1:]):
+        return df
+    return df.iloc[np.argsort(keys, kind="stable")]
+
+
+class SnapshotIndex:
+    def __init__(self, snapshots, row_counts) -> None:
+        # snapshots are expected in chronological order, see `from_counts` and `from_frame`
+        self.snapshots = list(snapshots)
+        self.dates = pd.to_datetime(
+            pd.Series(self.snapshots, dtype=object),
+            format=schema.SNAPSHOT_FORMAT,
+            errors="coerce",
+        )
+        self.offsets = np.concatenate([[0], np.cumsum(row_counts)]).astype(np.int64)
+        self._positions = {snap: pos for pos, snap in enumerate(self.snapshots)}
+
+    @classmethod
+    def from_counts(cls, snapshots, row_counts):
+        """
+        The function `from_counts` indexes data made of consecutive snapshot blocks, such as the snapshot
+        store loaded in chronological order, without reading the data itself.
+
+        :param snapshots: The snapshot_date values, in any order
+        :param row_counts: The number of rows of each snapshot, in the same order as `snapshots`
+        :return: The `SnapshotIndex` of the data.
+        """
+        counts = dict(zip(snapshots, row_counts))
+        ordered = schema.sort_snapshots(counts)
+        return cls(ordered, [counts[snap] for snap in ordered])
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, snap_column=SNAP_COLUMN):
+        """
+        The function `from_frame` indexes a DataFrame sorted by `sort_frame`.
+
+        :param df: A typed DataFrame sorted chronologically by snapshot
+        :type df: pd.DataFrame
+        :return: The `SnapshotIndex` of `df`, or `None` if `df` is `None`.
+        """
+        if df is None:
+            return None
+        snapshots = df[snap_column]
+        codes = snapshots.cat.codes.to_numpy()
+        counts = np.bincount(codes[codes >= 0], minlength=len(snapshots.cat.categories))
+        present = counts > 0
+        return cls(list(snapshots.cat.categories[present]), counts[present].tolist())
+
+    def __contains__(self, snapshot) -> bool:
+        return snapshot in self._positions
+
+    def bounds(self, snapshot) -> tuple:
+        """
+        The function `bounds` returns the row range of a snapshot.
+
+        :param snapshot: The snapshot_date value looked at
+        :return: A `(start, stop)` tuple of row positions.
+        :raises KeyError: If the snapshot is not indexed.
+        """
+        pos = self._positions[snapshot]
+        return int(self.offsets[pos]), int(self.offsets[pos + 1])
+
+    def slice(self, df: pd.DataFrame, snapshot) -> pd.DataFrame:
+        """
+        The function `slice` selects the rows of a snapshot from the indexed DataFrame.
+
+        :param df: The DataFrame the index was built from
+        :type df: pd.DataFrame
+        :param snapshot: The snapshot_date value looked at
+        :return: The rows of `snapshot`.
+        """
+        start, stop = self.bounds(snapshot)
+        return df.iloc[start:stop]
+
+    def last(self, count=2) -> list:
+        """
+        The function `last` returns the most recent snapshots, oldest first.
+
+        :param count: How many snapshots to return, defaults to 2
+        :return: A list of snapshot_date values.
+        """
+        return self.snapshots[-count:]
@@ -0,0 +1,251 @@
+import json
+import os
+import re
+import pandas as pd
+from . import schema
+
+try:
+    import pyarrow  # noqa: F401
+
+    PARQUET_AVAILABLE = True
+except ImportError:
+    PARQUET_AVAILABLE = False
+
+"""
+@package docstring
+
+This file manages the columnar working copy of the raw data.
+Every snapshot_date is stored as its own Parquet partition and a manifest keeps the order of the
+snapshots, the row counts and the signature of the workbook they were imported from. The Excel workbook
+is only used to import data into the store and to export it back for viewing.
+
+"""
+
+
+class SnapshotStore:
+    def __init__(
+        self,
+        root=os.path.join("raw_data", "snapshots"),
+        snap_column="snapshot_date",
+    ) -> None:
+        self.root = root
+        self.snap_column = snap_column
+        self.manifest_path = os.path.join(self.root, "manifest.json")
+
+    def available(self) -> bool:
+        """
+        The function `available` tells if the store can be used in the current environment.
+        :return: `True` if a Parquet engine (pyarrow) is installed, `False` otherwise.
+        """
+        return PARQUET_AVAILABLE
+
+    def exists(self) -> bool:
+        """
+        The function `exists` checks if the store was already built.
+        :return: `True` if the manifest file exists, `False` otherwise.
+        """
+        return os.path.isfile(self.manifest_path)
+
+    def read_manifest(self) -> dict:
+        """
+        The function `read_manifest` loads the manifest of the store.
+        :return: A dictionary with the keys `source`, `columns`, `categories` and `partitions`. An empty
+        manifest is returned if the store was not built yet.
+        """
+        if not self.exists():
+            return {"source": None, "columns": [], "categories": {}, "partitions": []}
+        with open(self.manifest_path, "r") as mf:
+            return json.load(mf)
+
+    def _write_manifest(self, manifest: dict):
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, "w") as mf:
+            json.dump(manifest, mf, indent=4)
+        os.replace(tmp_path, self.manifest_path)
+
+    def snapshots(self) -> list:
+        """
+        The function `snapshots` lists the snapshots held by the store, in the order they were added.
+        :return: A list of snapshot_date values.
+        """
+        return [part["snapshot"] for part in self.read_manifest()["partitions"]]
+
+    def row_counts(self) -> list:
+        """
+        The function `row_counts` lists the number of rows of every snapshot, in the same order as
+        `snapshots`.
+        :return: A list of integers.
+        """
+        return [part["rows"] for part in self.read_manifest()["partitions"]]
+
+    def categories(self) -> dict:
+        """
+        The function `categories` returns the values of every categorical column across all partitions,
+        so partitions read separately can share the same categories.
+        :return: A dictionary mapping column names, including the snapshot column, to their values. The
+        snapshots are in chronological order, whatever the order they were added in.
+        """
+        manifest = self.read_manifest()
+        categories = dict(manifest.get("categories", {}))
+        categories[self.snap_column] = schema.sort_snapshots(
+            part["snapshot"] for part in manifest["partitions"]
+        )
+        return categories
+
+    def source_signature(self):
+        """
+        The function `source_signature` returns the signature of the workbook the store was last synced
+        with.
+        :return: A `[mtime_ns, size]` list, or `None` if the store was never synced with a workbook.
+        """
+        return self.read_manifest()["source"]
+
+    def set_source_signature(self, signature):
+        """
+        The function `set_source_signature` records the signature of the workbook the store is in sync
+        with, so the workbook is not imported again.
+
+        :param signature: The `(mtime_ns, size)` signature of the workbook
+        """
+        manifest = self.read_manifest()
+        manifest["source"] = None if signature is None else list(signature)
+        self._write_manifest(manifest)
+
+    def partition_path(self, snapshot) -> str:
+        """
+        The function `partition_path` builds the path of the Parquet file holding one snapshot.
+
+        :param snapshot: The snapshot_date value of the partition
+        :return: The path of the partition file.
+        """
+        safe_name = re.sub(r"[^0-9A-Za-z_.-]", "_", str(snapshot))
+        return os.path.join(self.root, f"{self.snap_column}={safe_name}.parquet")
+
+    def write_partition(self, df: pd.DataFrame, snapshot):
+        """
+        The function `write_partition` writes the rows of one snapshot to its partition and registers it
+        in the manifest. An existing partition for the same snapshot is replaced.
+
+        :param df: The rows belonging to `snapshot`
+        :type df: pd.DataFrame
+        :param snapshot: The snapshot_date value of the rows
+        """
+        os.makedirs(self.root, exist_ok=True)
+        path = self.partition_path(snapshot)
+        tmp_path = f"{path}.tmp"
+        _normalize_objects(df).to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, path)
+
+        manifest = self.read_manifest()
+        entry = {
+            "snapshot": snapshot,
+            "file": os.path.basename(path),
+            "rows": int(len(df)),
+        }
+        partitions = manifest["partitions"]
+        for idx, part in enumerate(partitions):
+            if part["snapshot"] == snapshot:
+                partitions[idx] = entry
+                break
+        else:
+            partitions.append(entry)
+        manifest["columns"] = manifest["columns"] or list(df.columns)
+        manifest["categories"] = schema.merge_category_values(
+            manifest.get("categories", {}), schema.category_values(df)
+        )
+        self._write_manifest(manifest)
+
+    def clear(self, source_signature=None):
+        """
+        The function `clear` removes every partition from the store and leaves an empty manifest behind.
+
+        :param source_signature: The signature of the workbook the empty store is in sync with, defaults
+        to None
+        """
+        os.makedirs(self.root, exist_ok=True)
+        for part in self.read_manifest()["partitions"]:
+            old_path = os.path.join(self.root, part["file"])
+            if os.path.isfile(old_path):
+                os.remove(old_path)
+        self._write_manifest(
+            {
+                "source": None if source_signature is None else list(source_signature),
+                "columns": [],
+                "categories": {},
+                "partitions": [],
+            }
+        )
+
+    def import_frame(self, df: pd.DataFrame, source_signature=None):
+        """
+        The function `import_frame` rebuilds the store from a full DataFrame, one partition per
+        snapshot_date, keeping the order in which the snapshots first appear.
+
+        :param df: A raw data like DataFrame
+        :type df: pd.DataFrame
+        :param source_signature: The signature of the workbook `df` was read from, defaults to None
+        """
+        self.clear(source_signature)
+        for snapshot, part_df in df.groupby(self.snap_column, sort=False):
+            self.write_partition(part_df, snapshot)
+
+    def read_partition(self, snapshot, columns=None) -> pd.DataFrame:
+        """
+        The function `read_partition` reads a single snapshot from the store.
+
+        :param snapshot: The snapshot_date value to read
+        :param columns: The columns to read; every column is read when `None`, defaults to None
+        :return: A DataFrame with the rows of `snapshot`.
+        """
+        return pd.read_parquet(
+            self.partition_path(snapshot),
+            columns=None if columns is None else list(columns),
+        )
+
+    def load(self, columns=None, snapshots=None) -> pd.DataFrame:
+        """
+        The function `load` reads the store, only touching the requested partitions and columns.
+
+        :param columns: The columns to read; every column is read when `None`, defaults to None
+        :param snapshots: The snapshots to read; every snapshot is read when `None`, defaults to None
+        :return: A DataFrame with the requested data, or `None` if the store holds no rows.
+        """
+        wanted = self.snapshots() if snapshots is None else list(snapshots)
+        frames = [self.read_partition(snap, columns) for snap in wanted]
+        if not frames:
+            return None
+        return pd.concat(frames, ignore_index=True)
+
+    def export_excel(self, file_name: str):
+        """
+        The function `export_excel` writes the whole store to an Excel workbook, so it can be opened by
+        the users.
+
+        :param file_name: The path of the workbook
+        :type file_name: str
+        """
+        content = self.load()
+        if content is not None:
+            content.to_excel(file_name, index=False)
+
+
+def _normalize_objects(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    The function `_normalize_objects` converts object columns that mix strings with numbers (e.g. postal
+    codes) to strings, since a Parquet column can only hold a single type.
+
+    :param df: The DataFrame about to be written
+    :type df: pd.DataFrame
+    :return: A DataFrame safe to write to Parquet.
+    """
+    mixed = [
+        col
+        for col in df.columns
+        if df[col].dtype == object and df[col].dropna().map(type).nunique() > 1
+    ]
+    if not mixed:
+        return df
+    df = df.copy()
+    for col in mixed:
+        df[col] = df[col].where(df[col].isna(), df[col].astype(str))
+    return df
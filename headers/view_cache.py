@@ -0,0 +1,72 @@
+import threading
+from collections import OrderedDict
+
+"""
+@package docstring
+
+This file keeps the views of the app (computed tables and the controls showing them) for the selections
+visited recently.
+Views are keyed by the version of the dataset, the kind of view and the selection, so coming back to a
+department or a market is a lookup. The cache holds a bounded number of views, dropping the least
+recently used one first, and forgets every view of an older dataset as soon as a new version is seen.
+
+"""
+
+
+# number of views kept, each one holds a small KPI table and its Flet control
+VIEW_CACHE_SIZE = 32
+
+
+class ViewCache:
+    def __init__(self, max_entries: int = VIEW_CACHE_SIZE) -> None:
+        """
+        :param max_entries: The number of views kept, defaults to `VIEW_CACHE_SIZE`
+        """
+        if max_entries < 1:
+            raise ValueError(f"max_entries must be at least 1, not {max_entries}")
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._version = None
+
+    def get_or_build(self, version, view: str, selection, builder):
+        """
+        The function `get_or_build` returns the cached view of a selection, calling `builder` only when it
+        is not cached for the current version of the dataset.
+
+        :param version: The version of the dataset, e.g. the signature of the raw data file
+        :param view: The kind of view, e.g. "department" or "market"
+        :type view: str
+        :param selection: A hashable value describing what the view shows, e.g. the selected department
+        :param builder: A callable without arguments building the view
+        :return: The view, as returned by `builder`.
+        """
+        key = (version, view, selection)
+        with self._lock:
+            if version != self._version:
+                self._entries.clear()
+                self._version = version
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+
+        content = builder()
+
+        with self._lock:
+            if version == self._version:
+                self._entries[key] = content
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return content
+
+    def invalidate(self) -> None:
+        """
+        The function `invalidate` drops every cached view.
+        """
+        with self._lock:
+            self._entries.clear()
+            self._version = None
+
+    def __len__(self) -> int:
+        return len(self._entries)